@@ -0,0 +1,100 @@
+"""Benchmark lazy page loading.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+
+Usage: python benchmarks/lazy_pages.py [PAGES...]
+
+For documents of each of the given numbers of pages (by default, 1000,
+10000 and 100000), reports the time taken by psselect to select a few pages,
+and, for comparison, the time taken to read the whole page tree. The time
+taken by psselect still grows slowly with the document's length, as pypdf
+reads the whole cross-reference table.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from pypdf import PdfWriter
+from pypdf.errors import PyPdfError
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+)
+
+from psutils.command.psselect import psselect
+from psutils.readers import PdfReader
+
+
+# Number of kids of each node of the page tree
+FANOUT = 10
+
+SELECTIONS = ["5", "1-10", "1-100"]
+
+
+# Write a document with the given number of pages to `filename', with a
+# balanced page tree, as most PDF producers write.
+def make_document(filename: str, pages: int) -> None:
+    writer = PdfWriter()
+    content = DecodedStreamObject()
+    content.set_data(b"BT /F1 24 Tf 72 72 Td (page) Tj ET")
+    content_ref = writer._add_object(content)
+    nodes = []
+    for _ in range(pages):
+        page = DictionaryObject()
+        page[NameObject("/Type")] = NameObject("/Page")
+        page[NameObject("/Contents")] = content_ref
+        nodes.append((writer._add_object(page), 1))
+    while len(nodes) > 1:
+        parents = []
+        for i in range(0, len(nodes), FANOUT):
+            kids = nodes[i : i + FANOUT]
+            node = DictionaryObject()
+            node[NameObject("/Type")] = NameObject("/Pages")
+            node[NameObject("/Kids")] = ArrayObject(ref for ref, _ in kids)
+            node[NameObject("/Count")] = NumberObject(sum(n for _, n in kids))
+            ref = writer._add_object(node)
+            for kid, _ in kids:
+                kid.get_object()[NameObject("/Parent")] = ref
+            parents.append((ref, node[NameObject("/Count")]))
+        nodes = parents
+    root = nodes[0][0].get_object()
+    root[NameObject("/MediaBox")] = ArrayObject(
+        NumberObject(x) for x in (0, 0, 595, 842)
+    )
+    del writer._root_object[NameObject("/Pages")]
+    writer._root_object[NameObject("/Pages")] = nodes[0][0]
+    with open(filename, "wb") as f:
+        writer.write(f)
+
+
+def main(argv: list[str] = sys.argv[1:]) -> None:
+    sizes = [int(arg) for arg in argv] or [1000, 10000, 100000]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = os.path.join(tmpdir, "input.pdf")
+        outfile = os.path.join(tmpdir, "output.pdf")
+        print(f"{'pages':>8} {'selection':>10} {'time/s':>8}")
+        for pages in sizes:
+            make_document(infile, pages)
+            for selection in SELECTIONS:
+                start = time.perf_counter()
+                psselect(["--quiet", selection, infile, outfile])
+                elapsed = time.perf_counter() - start
+                print(f"{pages:>8} {selection:>10} {elapsed:>8.3f}")
+            start = time.perf_counter()
+            try:
+                with open(infile, "rb") as f:
+                    PdfReader(f, lazy=False).pages[4]
+                elapsed = f"{time.perf_counter() - start:.3f}"
+            except PyPdfError:  # pypdf limits the size of page trees it reads
+                elapsed = "failed"
+            print(f"{pages:>8} {'(eager)':>10} {elapsed:>8}")
+
+
+if __name__ == "__main__":
+    main()
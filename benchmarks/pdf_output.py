@@ -0,0 +1,58 @@
+"""Benchmark PDF output options.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+
+Usage: python benchmarks/pdf_output.py INFILE.pdf [PSTOPS-ARGUMENT...]
+
+Runs pstops with the given arguments (by default, none) on INFILE with
+each of the PDF output options, and reports the input and output sizes and
+the time taken.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from psutils.command.pstops import pstops
+
+
+OPTIONS = [
+    [],
+    ["--compress-level", "6"],
+    ["--compress-level", "9"],
+    ["--remove-duplicates"],
+    ["--object-streams"],
+    ["--prune-resources"],
+    [
+        "--prune-resources",
+        "--compress-level",
+        "9",
+        "--remove-duplicates",
+        "--object-streams",
+    ],
+]
+
+
+def main(argv: list[str] = sys.argv[1:]) -> None:
+    if len(argv) < 1:
+        sys.exit(__doc__)
+    infile, args = argv[0], argv[1:]
+    bytes_in = os.path.getsize(infile)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outfile = os.path.join(tmpdir, "output.pdf")
+        width = max(len(" ".join(options)) for options in OPTIONS)
+        print(f"{'options':<{width}} {'bytes in':>12} {'bytes out':>12} {'time/s':>8}")
+        for options in OPTIONS:
+            start = time.perf_counter()
+            pstops([*args, *options, "--quiet", infile, outfile])
+            elapsed = time.perf_counter() - start
+            bytes_out = os.path.getsize(outfile)
+            print(
+                f"{' '.join(options) or '(none)':<{width}} {bytes_in:>12} {bytes_out:>12} {elapsed:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
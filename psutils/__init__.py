@@ -4,7 +4,10 @@ Copyright (c) Reuben Thomas 2023.
 Released under the GPL version 3, or (at your option) any later version.
 """
 
+from .engines import *  # noqa: F403
+from .layout import *  # noqa: F403
 from .libpaper import *  # noqa: F403
+from .pipeline import *  # noqa: F403
 from .readers import *  # noqa: F403
 from .transformers import *  # noqa: F403
 from .types import *  # noqa: F403
@@ -8,10 +8,12 @@ import argparse
 import importlib.metadata
 import re
 from collections.abc import Callable
+from dataclasses import fields
 from typing import NoReturn
 
+from .engines import pdf_engine_modules
 from .libpaper import get_paper_size
-from .types import Offset, PageSpec, Range, Rectangle
+from .types import Offset, PageSpec, Range, Rectangle, TransformOptions
 from .warnings import die
 
 
@@ -33,6 +35,23 @@ def parserange(ranges_text: str) -> list[Range]:
     return ranges
 
 
+def parsesection(section_text: str) -> tuple[list[Range], str]:
+    ranges_text, equals, specs_text = section_text.partition("=")
+    if equals == "":
+        die(f"`{section_text}' is not of the form PAGES=SPECS")
+    return parserange(ranges_text), specs_text
+
+
+# A split is either a number of pages per file, or a list of page ranges.
+def parsesplit(split_text: str) -> int | list[Range]:
+    if split_text.isdigit():
+        pages = int(split_text)
+        if pages == 0:
+            die("number of pages per file must be greater than 0")
+        return pages
+    return parserange(split_text)
+
+
 def parsepaper(paper_size: str) -> Rectangle | None:
     try:
         size = get_paper_size(paper_size)
@@ -95,6 +114,12 @@ class PaperContext:
         return num
 
 
+def parsejobs(s: str) -> int:
+    if not re.fullmatch(r"\d+", s) or int(s) == 0:
+        die(f"number of jobs must be a positive integer: `{s}'")
+    return int(s)
+
+
 def specerror() -> NoReturn:
     die(
         """bad page specification:
@@ -247,6 +272,19 @@ def add_file_arguments(parser: argparse.ArgumentParser) -> None:
     )
 
 
+def add_split_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--split",
+        metavar="PAGES",
+        type=parsesplit,
+        help="""\
+write the output to numbered files named after
+OUTFILE, either PAGES pages to each file, or
+one file for each of the comma-separated output
+page ranges PAGES""",
+    )
+
+
 def add_paper_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "-p",
@@ -284,3 +322,118 @@ draw a line of given width (relative to original
 page) around each page [argument defaults to 1pt;
 default is no line; width is fixed for PDF]""",
     )
+
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--prune-resources",
+        action="store_true",
+        help="""\
+remove resources that are not used by each
+output page [PDF only]""",
+    )
+    parser.add_argument(
+        "--image-dpi",
+        metavar="DPI",
+        type=float,
+        help="""\
+downsample images that would be printed at a
+higher resolution than DPI [PDF only]""",
+    )
+    parser.add_argument(
+        "--dedupe-pages",
+        action="store_true",
+        help="""\
+write the content of input pages that are used more
+than once, or that are identical, only once, and
+refer to it each time it is used; PostScript output
+then needs a LanguageLevel 3 interpreter""",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="""\
+remove comments other than DSC comments, and
+white space that is not needed, from the prolog,
+setup and generated code [PostScript only]""",
+    )
+    parser.add_argument(
+        "--compress-pages",
+        action="store_true",
+        help="""\
+compress the code of each page, at the level given
+by --compress-level if any, to be decompressed by
+the printer, which must support LanguageLevel 3;
+with --jobs, pages are compressed in the worker
+processes [PostScript only]""",
+    )
+    add_compression_arguments(parser)
+    add_pdf_engine_argument(parser)
+    parser.add_argument(
+        "--jobs",
+        metavar="N",
+        type=parsejobs,
+        default=1,
+        help="""\
+write output pages in N worker processes
+[default: %(default)s]""",
+    )
+
+
+def add_compression_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--compress-level",
+        metavar="LEVEL",
+        type=int,
+        choices=range(10),
+        help="""\
+compress content streams that are not already
+compressed, at the given level (0-9) [PDF only]""",
+    )
+    parser.add_argument(
+        "--object-streams",
+        action="store_true",
+        help="""\
+pack objects into compressed object streams,
+with a cross-reference stream [PDF only]""",
+    )
+    parser.add_argument(
+        "--remove-duplicates",
+        action="store_true",
+        help="""\
+merge identical objects; the output is then held
+in memory until it is complete [PDF only]""",
+    )
+
+
+def add_pdf_engine_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--pdf-engine",
+        choices=list(pdf_engine_modules),
+        help="""\
+library used to process PDF documents [default:
+pypdf; PDF only]""",
+    )
+
+
+def add_incremental_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="""\
+append the new page order to a copy of the input
+as an incremental update, which is faster for
+large documents, but makes the output larger
+[PDF only]""",
+    )
+
+
+# Collect the output options given on the command line.
+def output_options(args: argparse.Namespace) -> TransformOptions:
+    return TransformOptions(
+        **{
+            f.name: getattr(args, f.name)
+            for f in fields(TransformOptions)
+            if f.name in args
+        }
+    )
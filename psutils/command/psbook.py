@@ -12,10 +12,14 @@ from psutils.argparse import (
     HelpFormatter,
     PaperContext,
     add_basic_arguments,
-    parserange,
+    add_incremental_argument,
+    add_output_arguments,
+    output_options,
     parsespecs,
 )
-from psutils.transformers import file_transform
+from psutils.pipeline import Stage, StagePlan, check_stage_args
+from psutils.transformers import file_transform, page_plan
+from psutils.types import PageList, PageSpec, Rectangle, SignatureOrder
 from psutils.warnings import die, simple_warning
 
 
@@ -45,6 +49,8 @@ number of pages per signature;
 1 = do not rearrange the pages;
 otherwise, a multiple of 4""",
     )
+    add_output_arguments(parser)
+    add_incremental_argument(parser)
     add_basic_arguments(parser)
 
     return parser
@@ -60,37 +66,18 @@ def psbook(argv: list[str] = sys.argv[1:]) -> None:
     paper_context = PaperContext()
     specs, modulo, flipping = parsespecs("0", paper_context)
     with file_transform(
-        args.infile, args.outfile, None, None, specs, 0, False
+        args.infile,
+        args.outfile,
+        None,
+        None,
+        specs,
+        0,
+        False,
+        output_options(args),
     ) as transform:
-        input_pages = transform.pages()
-
-        def page_index_to_real_page(signature: int, page_number: int) -> int:
-            real_page = page_number - page_number % signature
-            page_on_sheet = page_number % 4
-            recto_verso = (page_number % signature) // 2
-            if page_on_sheet in (0, 3):
-                real_page += signature - 1 - recto_verso
-            else:
-                real_page += recto_verso
-            return real_page + 1
-
-        # Adjust for signature size
-        signature = args.signature
-        if signature == 0:
-            maxpage = input_pages + (4 - input_pages % 4) % 4
-            signature = maxpage
-        else:
-            maxpage = input_pages + (signature - input_pages % signature) % signature
-
-        # Compute page list
-        page_list = []
-        for page in range(maxpage):
-            real_page = page_index_to_real_page(signature, page)
-            page_list.append(str(real_page) if real_page <= input_pages else "_")
-
         # Rearrange pages
         transform.transform_pages(
-            parserange(",".join(page_list)),
+            PageList.from_pages(SignatureOrder(transform.pages(), args.signature)),
             flipping,
             False,
             False,
@@ -100,5 +87,30 @@ def psbook(argv: list[str] = sys.argv[1:]) -> None:
         )
 
 
+# Make a pipeline stage from psbook arguments.
+def psbook_stage(argv: list[str]) -> Stage:
+    args = get_parser().parse_intermixed_args(argv)
+    check_stage_args(args)
+    if args.signature > 1 and args.signature % 4 != 0:
+        die("signature must be a multiple of 4")
+
+    def stage(total_pages: int, in_size: Rectangle) -> StagePlan:
+        return StagePlan(
+            page_plan(
+                total_pages,
+                [[PageSpec()]],
+                PageList.from_pages(SignatureOrder(total_pages, args.signature)),
+                False,
+                False,
+                False,
+                1,
+            ),
+            in_size,
+            None,
+        )
+
+    return stage
+
+
 if __name__ == "__main__":
     psbook()
@@ -11,9 +11,14 @@ import sys
 import warnings
 from typing import IO
 
-from pypdf import PdfReader, PdfWriter
-
-from psutils.argparse import HelpFormatter, add_version_argument
+from psutils.argparse import (
+    HelpFormatter,
+    add_compression_arguments,
+    add_pdf_engine_argument,
+    add_version_argument,
+    output_options,
+)
+from psutils.engines import pdf_engine
 from psutils.io import setup_inputs_and_output
 from psutils.warnings import die, simple_warning
 
@@ -26,7 +31,8 @@ def get_parser() -> argparse.ArgumentParser:
         usage="%(prog)s [OPTION...] [FILE...]",
         add_help=False,
         epilog="""
-The --save and --nostrip options only apply to PostScript files.
+The --save and --nostrip options only apply to PostScript files, and the
+compression options only to PDF files.
 """,
     )
     warnings.showwarning = simple_warning(parser.prog)
@@ -47,6 +53,8 @@ The --save and --nostrip options only apply to PostScript files.
         action="store_true",
         help="do not strip prolog or trailer from input files",
     )
+    add_compression_arguments(parser)
+    add_pdf_engine_argument(parser)
     parser.add_argument("--help", action="help", help="show this help message and exit")
     add_version_argument(parser)
     parser.add_argument(
@@ -59,21 +67,11 @@ The --save and --nostrip options only apply to PostScript files.
     return parser
 
 
-# FIXME: Move the logic for merging PdfReader documents into library.
 def join_pdf(
     args: argparse.Namespace, infiles: list[IO[bytes]], outfile: IO[bytes]
 ) -> None:
-    # Merge input files
-    out_pdf = PdfWriter()
-    for file in infiles:
-        in_pdf = PdfReader(file)
-        out_pdf.append(in_pdf)
-        if args.even and len(in_pdf.pages) % 2 == 1:
-            out_pdf.add_blank_page()
-
-    # Write output
-    out_pdf.write(outfile)
-    sys.stdout.buffer.flush()
+    options = output_options(args)
+    pdf_engine(options.pdf_engine, options).join(infiles, outfile, args.even, options)
 
 
 # FIXME: Move the logic for merging PsReader documents into library.
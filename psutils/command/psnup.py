@@ -17,14 +17,17 @@ from psutils.argparse import (
     PaperContext,
     add_basic_arguments,
     add_draw_argument,
+    add_output_arguments,
     add_paper_arguments,
-    parsespecs,
+    output_options,
 )
 from psutils.io import setup_input_and_output
+from psutils.layout import nup_layout
 from psutils.libpaper import get_paper_size
+from psutils.pipeline import Stage, StagePlan, check_stage_args
 from psutils.readers import document_reader
-from psutils.transformers import document_transform
-from psutils.types import Rectangle
+from psutils.transformers import document_transform, page_plan
+from psutils.types import PageList, PageSpec, Rectangle, SignatureOrder
 from psutils.warnings import die, simple_warning
 
 
@@ -107,6 +110,7 @@ as the original page margins will be shrunk""",
         help="width of border around each input page",
     )
     add_draw_argument(parser, paper_context)
+    add_output_arguments(parser)
     parser.add_argument(
         "-l",
         "--rotatedleft",
@@ -128,6 +132,23 @@ as the original page margins will be shrunk""",
         action=ToggleAction,
         help="swap columns and rows (column-major order)",
     )
+    parser.add_argument(
+        "--booklet",
+        action="store_true",
+        help="""\
+first rearrange the pages into signatures, as
+psbook does; use with -2 to impose a booklet""",
+    )
+    parser.add_argument(
+        "-s",
+        "--signature",
+        type=int,
+        default=0,
+        help="""\
+number of pages per signature with --booklet;
+0 = all pages in one signature [default];
+otherwise, a multiple of 4""",
+    )
     parser.add_argument(
         "-t",
         "--tolerance",
@@ -151,10 +172,48 @@ def get_parser_manpages() -> argparse.ArgumentParser:
     return get_parser()[0]
 
 
+# Work out the layout of the input pages, of size `in_size', on the output
+# pages, of size `size', returning the page specs, modulo, and the output
+# page size.
+def nup_specs(
+    args: argparse.Namespace,
+    size: Rectangle,
+    in_size: Rectangle,
+) -> tuple[list[list[PageSpec]], int, Rectangle]:
+    rowmajor, leftright, topbottom = True, True, True
+    if args.transpose:
+        rowmajor = False
+    if args.rotatedleft:
+        rowmajor = not rowmajor
+        topbottom = not topbottom
+    if args.rotatedright:
+        rowmajor = not rowmajor
+        leftright = not leftright
+
+    # Take account of flip
+    if args.flip:
+        size = Rectangle(size.height, size.width)
+
+    specs = nup_layout(
+        args.nup,
+        size,
+        in_size,
+        args.margin,
+        args.border,
+        args.tolerance,
+        rowmajor,
+        leftright,
+        topbottom,
+    )
+    return [specs], args.nup, size
+
+
 # FIXME: Move calculation logic into DocumentTransform class.
 def psnup(argv: list[str] = sys.argv[1:]) -> None:
-    parser, paper_context = get_parser()
+    parser, _ = get_parser()
     args = parser.parse_intermixed_args(argv)
+    if args.signature > 1 and args.signature % 4 != 0:
+        die("signature must be a multiple of 4")
     size: Rectangle | None = None
     in_size: Rectangle | None = None
 
@@ -162,7 +221,7 @@ def psnup(argv: list[str] = sys.argv[1:]) -> None:
         args.infile,
         args.outfile,
     ) as (infile, file_type, outfile):
-        doc = document_reader(infile, file_type)
+        doc = document_reader(infile, file_type, output_options(args), args.draw)
         if args.paper:
             size = args.paper
         elif args.width is not None and args.height is not None:
@@ -174,17 +233,6 @@ def psnup(argv: list[str] = sys.argv[1:]) -> None:
         elif doc.size is not None and not doc.size_guessed:
             in_size = Rectangle(doc.size.width, doc.size.height)
 
-        # Process command-line arguments
-        rowmajor, leftright, topbottom = True, True, True
-        if args.transpose:
-            rowmajor = False
-        if args.rotatedleft:
-            rowmajor = not rowmajor
-            topbottom = not topbottom
-        if args.rotatedright:
-            rowmajor = not rowmajor
-            leftright = not leftright
-
         if size is None and ((args.width is None) ^ (args.height is None)):
             die("output page width and height must both be set, or neither")
         if in_size is None and ((args.inwidth is None) ^ (args.inheight is None)):
@@ -210,113 +258,58 @@ def psnup(argv: list[str] = sys.argv[1:]) -> None:
             die("output page size not set, and could not get default paper size")
         assert(in_size)
 
-        # Take account of flip
-        if args.flip:
-            size = Rectangle(size.height, size.width)
-
-        # Find next larger exact divisor > n of m, or 0 if none; return divisor
-        # and dividend.
-        # There is probably a much more efficient method of doing this, but the
-        # numbers involved are small.
-        def nextdiv(n: int, m: int) -> tuple[int, int]:
-            while n < m:
-                n += 1
-                if m % n == 0:
-                    return n, m // n
-            return 0, 0
-
-        # Calculate paper dimensions, subtracting paper margin from height & width
-        ppwid, pphgt = size.width - args.margin * 2, size.height - args.margin * 2
-        if ppwid <= 0 or pphgt <= 0:
-            die("margin is too large")
-        if args.border > min(ppwid, pphgt):
-            die("border is too large")
-
-        # Finding the best layout is an optimisation problem. We try all of the
-        # combinations of width*height in both normal and rotated form, and
-        # minimise the wasted space.
-        best = args.tolerance
-        horiz = 0.0
-        vert = 0.0
-        rotate = False
-
-        def reduce_waste(
-            hor: float, ver: float, iwid: float, ihgt: float, rot: bool
-        ) -> None:
-            nonlocal best, horiz, vert, rotate
-            scl = min(pphgt / (ihgt * ver), ppwid / (iwid * hor))
-            waste = (ppwid - scl * iwid * hor) ** 2 + (pphgt - scl * ihgt * ver) ** 2
-            if waste < best:
-                best, horiz, vert, rotate = waste, hor, ver, rot
-
-        hor, ver = 1, args.nup
-        while hor != 0:
-            reduce_waste(
-                hor, ver, in_size.width, in_size.height, False
-            )  # normal orientation
-            reduce_waste(
-                ver, hor, in_size.height, in_size.width, True
-            )  # rotated orientation
-            hor, ver = nextdiv(hor, args.nup)
-
-        # Fail if nothing better than tolerance was found
-        if best == args.tolerance:
-            die(f"can't find acceptable layout for {args.nup}-up")
-
-        # Take account of rotation
-        orig_in_size = copy(in_size)
-        if rotate:
-            topbottom, leftright, rowmajor, in_size.width, in_size.height = (
-                not leftright,
-                topbottom,
-                not rowmajor,
-                in_size.height,
-                in_size.width,
+        specs, modulo, size = nup_specs(args, size, in_size)
+        transform = document_transform(
+            doc,
+            outfile,
+            size,
+            in_size,
+            specs,
+            args.draw,
+            in_size_guessed,
+            output_options(args),
+            args.infile if args.infile != "-" else None,
+        )
+        page_list = None
+        if args.booklet:
+            page_list = PageList.from_pages(
+                SignatureOrder(transform.pages(), args.signature)
             )
-
-        # Calculate page scale, allowing for internal borders
-        scale = min(
-            (pphgt - 2 * args.border * vert) / (in_size.height * vert),
-            (ppwid - 2 * args.border * horiz) / (in_size.width * horiz),
+        transform.transform_pages(
+            page_list, False, False, False, False, modulo, args.verbose
         )
 
-        # Page centring shifts
-        hshift, vshift = (ppwid / horiz - in_size.width * scale) / 2, (
-            pphgt / vert - in_size.height * scale
-        ) / 2
-
-        # Construct specification list
-        spec_list = []
-        for page in range(args.nup):
-            across, up = (
-                (page % horiz, page // horiz)
-                if rowmajor
-                else (page // vert, page % vert)
-            )
-            if not leftright:
-                across = horiz - 1 - across
-            if topbottom:
-                up = vert - 1 - up
-            if rotate:
-                xoff = args.margin + (across + 1) * ppwid / horiz - hshift
-            else:
-                xoff = args.margin + across * ppwid / horiz + hshift
-            yoff = args.margin + up * pphgt / vert + vshift
-            spec_list.append(
-                f'{page}{"L" if rotate else ""}@{scale:f}({xoff:f},{yoff:f})'
-            )
 
-        # Rearrange pages
-        specs, modulo, flipped = parsespecs(
-            f'{args.nup}:{"+".join(spec_list)}', paper_context
-        )
-        transform = document_transform(
-            doc, outfile, size, orig_in_size, specs, args.draw, in_size_guessed
-        )
-        transform.transform_pages(
-            None, flipped, False, False, False, modulo, args.verbose
+# Make a pipeline stage from psnup arguments.
+def psnup_stage(argv: list[str]) -> Stage:
+    parser, _ = get_parser()
+    args = parser.parse_intermixed_args(argv)
+    check_stage_args(args)
+    if args.signature > 1 and args.signature % 4 != 0:
+        die("signature must be a multiple of 4")
+
+    def stage(total_pages: int, in_size: Rectangle) -> StagePlan:
+        if args.inpaper:
+            in_size = args.inpaper
+        elif args.inwidth is not None and args.inheight is not None:
+            in_size = Rectangle(args.inwidth, args.inheight)
+        size = copy(in_size)
+        if args.paper:
+            size = args.paper
+        elif args.width is not None and args.height is not None:
+            size = Rectangle(args.width, args.height)
+        specs, modulo, size = nup_specs(args, size, in_size)
+        page_list = None
+        if args.booklet:
+            page_list = PageList.from_pages(SignatureOrder(total_pages, args.signature))
+        return StagePlan(
+            page_plan(total_pages, specs, page_list, False, False, False, modulo),
+            in_size,
+            size,
         )
 
+    return stage
+
 
 if __name__ == "__main__":
     psnup()
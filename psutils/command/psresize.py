@@ -7,10 +7,28 @@ Released under the GPL version 3, or (at your option) any later version.
 import argparse
 import sys
 import warnings
+from copy import copy
 
-from psutils.argparse import HelpFormatter, add_basic_arguments
-from psutils.command.psnup import psnup
-from psutils.warnings import simple_warning
+from psutils.argparse import (
+    HelpFormatter,
+    add_basic_arguments,
+    add_output_arguments,
+    add_paper_arguments,
+    output_options,
+)
+from psutils.io import setup_input_and_output
+from psutils.libpaper import get_paper_size
+from psutils.pipeline import Stage, StagePlan, check_stage_args
+from psutils.readers import document_reader
+from psutils.transformers import DocumentTransform, document_transform, page_plan
+from psutils.types import (
+    ImpositionPlan,
+    Offset,
+    PageSpec,
+    Placement,
+    Rectangle,
+)
+from psutils.warnings import die, simple_warning
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -28,51 +46,163 @@ pstops(1) for more details.
     warnings.showwarning = simple_warning(parser.prog)
 
     # Command-line parser
-    parser.add_argument(
-        "-p",
-        "--paper",
-        help="output paper name or dimensions (WIDTHxHEIGHT)",
-    )
-    parser.add_argument(
-        "-P",
-        "--inpaper",
-        help="input paper name or dimensions (WIDTHxHEIGHT)",
-    )
+    add_paper_arguments(parser)
+    add_output_arguments(parser)
     add_basic_arguments(parser)
 
-    # Backwards compatibility
-    parser.add_argument("-w", "--width", help=argparse.SUPPRESS)
-    parser.add_argument("-h", "--height", help=argparse.SUPPRESS)
-    parser.add_argument("-W", "--inwidth", help=argparse.SUPPRESS)
-    parser.add_argument("-H", "--inheight", help=argparse.SUPPRESS)
-
     return parser
 
 
-def psresize(argv: list[str] = sys.argv[1:]) -> None:
-    args = get_parser().parse_intermixed_args(argv)
+# Return the spec that scales a page of size `in_size' to fit a page of
+# size `size', and centres it. The page is turned on its side if it then
+# fits with less wasted space.
+def resize_spec(size: Rectangle, in_size: Rectangle) -> PageSpec:
+    def fit(width: float, height: float) -> tuple[float, float]:
+        scale = min(size.width / width, size.height / height)
+        waste = (size.width - scale * width) ** 2 + (size.height - scale * height) ** 2
+        return scale, waste
+
+    scale, waste = fit(in_size.width, in_size.height)
+    rotated_scale, rotated_waste = fit(in_size.height, in_size.width)
+    if rotated_waste < waste:
+        hshift = (size.width - in_size.height * rotated_scale) / 2
+        vshift = (size.height - in_size.width * rotated_scale) / 2
+        return PageSpec(
+            rotate=90,
+            scale=rotated_scale,
+            off=Offset(size.width - hshift, vshift),
+        )
+    hshift = (size.width - in_size.width * scale) / 2
+    vshift = (size.height - in_size.height * scale) / 2
+    return PageSpec(scale=scale, off=Offset(hshift, vshift))
+
 
-    # Resize pages
-    cmd = ["-1"]
-    if not args.verbose:
-        cmd.append("--quiet")
-    if args.width:
-        cmd.extend(["--width", args.width])
-    if args.height:
-        cmd.extend(["--width", args.height])
-    if args.inwidth:
-        cmd.extend(["--inwidth", args.inwidth])
-    if args.inheight:
-        cmd.extend(["--inheight", args.inheight])
+# Plan the resizing of the pages of a document of `total_pages' pages of
+# size `in_size' to `size'. If `page_sizes' is given, it gives the size of
+# each page, or None if it is not known, and each page is fitted to the
+# output page according to its own size.
+def resize_plan(
+    total_pages: int,
+    size: Rectangle,
+    in_size: Rectangle,
+    page_sizes: list[Rectangle | None] | None = None,
+) -> ImpositionPlan:
+    spec = resize_spec(size, in_size)
+    if page_sizes is None or all(
+        page_size is None or page_size == in_size for page_size in page_sizes
+    ):
+        return page_plan(total_pages, [[spec]], None, False, False, False, 1)
+    specs = {(in_size.width, in_size.height): spec}
+
+    def page_spec(page_size: Rectangle | None) -> PageSpec:
+        if page_size is None:
+            return spec
+        key = (page_size.width, page_size.height)
+        if key not in specs:
+            specs[key] = resize_spec(size, page_size)
+        return specs[key]
+
+    return ImpositionPlan.from_placements(
+        [(Placement(page_spec(page_size), page), page)]
+        for page, page_size in enumerate(page_sizes)
+    )
+
+
+# Return the sizes of the output and input pages given by `args', or None
+# for those that are not given.
+def paper_sizes(
+    args: argparse.Namespace,
+) -> tuple[Rectangle | None, Rectangle | None]:
+    size: Rectangle | None = None
+    in_size: Rectangle | None = None
     if args.paper:
-        cmd.extend(["--paper", args.paper])
+        size = args.paper
+    elif args.width is not None and args.height is not None:
+        size = Rectangle(args.width, args.height)
+    elif (args.width is None) ^ (args.height is None):
+        die("output page width and height must both be set, or neither")
     if args.inpaper:
-        cmd.extend(["--inpaper", args.inpaper])
-    if args.infile is not None:
-        cmd.append(args.infile)
-    if args.outfile is not None:
-        cmd.append(args.outfile)
-    psnup(cmd)
+        in_size = args.inpaper
+    elif args.inwidth is not None and args.inheight is not None:
+        in_size = Rectangle(args.inwidth, args.inheight)
+    elif (args.inwidth is None) ^ (args.inheight is None):
+        die("input page width and height must both be set, or neither")
+    return size, in_size
+
+
+# Return the size of each input page that has its own size.
+def page_sizes(transform: DocumentTransform) -> list[Rectangle | None]:
+    return [transform.page_size(n) for n in range(transform.pages())]
+
+
+def psresize(argv: list[str] = sys.argv[1:]) -> None:
+    args = get_parser().parse_intermixed_args(argv)
+    size, in_size = paper_sizes(args)
+
+    with setup_input_and_output(args.infile, args.outfile) as (
+        infile,
+        file_type,
+        outfile,
+    ):
+        doc = document_reader(infile, file_type, output_options(args))
+        # Pages are fitted according to their own sizes unless the input
+        # page size is given.
+        fit_pages = in_size is None
+        if in_size is None and doc.size is not None and not doc.size_guessed:
+            in_size = Rectangle(doc.size.width, doc.size.height)
+
+        # If input page size is undefined, use guess or output value if available
+        in_size_guessed = False
+        if in_size is None:
+            in_size = doc.size if doc.size is not None else size
+            in_size_guessed = True
+
+        # If output page size is undefined, set from input value if available
+        if size is None and in_size is not None:
+            size = copy(in_size)
+
+        # Ensure input and output page sizes are set, using `paper` if necessary
+        if size is None or in_size is None:
+            paper_size = get_paper_size()
+            if paper_size is not None:
+                size = paper_size
+                in_size = paper_size
+        if size is None or in_size is None:
+            die("output page size not set, and could not get default paper size")
+
+        transform = document_transform(
+            doc,
+            outfile,
+            size,
+            in_size,
+            [[PageSpec()]],
+            0,
+            in_size_guessed,
+            output_options(args),
+            args.infile if args.infile != "-" else None,
+        )
+        plan = resize_plan(
+            transform.pages(),
+            size,
+            in_size,
+            page_sizes(transform) if fit_pages else None,
+        )
+        transform.write_pages(plan, args.verbose)
+
+
+# Make a pipeline stage from psresize arguments.
+def psresize_stage(argv: list[str]) -> Stage:
+    args = get_parser().parse_intermixed_args(argv)
+    check_stage_args(args)
+    size, stage_in_size = paper_sizes(args)
+
+    def stage(total_pages: int, in_size: Rectangle) -> StagePlan:
+        if stage_in_size is not None:
+            in_size = stage_in_size
+        out_size = size if size is not None else copy(in_size)
+        return StagePlan(resize_plan(total_pages, out_size, in_size), in_size, out_size)
+
+    return stage
 
 
 if __name__ == "__main__":
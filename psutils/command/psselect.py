@@ -12,10 +12,16 @@ from psutils.argparse import (
     HelpFormatter,
     PaperContext,
     add_basic_arguments,
+    add_incremental_argument,
+    add_output_arguments,
+    add_split_argument,
+    output_options,
     parserange,
     parsespecs,
 )
-from psutils.transformers import file_transform
+from psutils.pipeline import Stage, StagePlan, check_stage_args
+from psutils.transformers import file_transform, page_plan
+from psutils.types import PageSpec, Rectangle
 from psutils.warnings import die, simple_warning
 
 
@@ -48,12 +54,15 @@ pstops(1) for more details.
         help="reverse the order of the output pages",
     )
     parser.add_argument("alt_pages", metavar="PAGES", nargs="?", help=argparse.SUPPRESS)
+    add_output_arguments(parser)
+    add_incremental_argument(parser)
+    add_split_argument(parser)
     add_basic_arguments(parser)
 
     return parser
 
 
-def psselect(argv: list[str] = sys.argv[1:]) -> None:
+def parse_args(argv: list[str]) -> argparse.Namespace:
     args = get_parser().parse_intermixed_args(argv)
 
     # Get page range argument if supplied as a non-option
@@ -73,18 +82,55 @@ def psselect(argv: list[str] = sys.argv[1:]) -> None:
                     die("--pages must be used when --even, --odd or --reverse is used")
             args.outfile = args.infile
             args.infile = args.alt_pages
+    return args
+
+
+def psselect(argv: list[str] = sys.argv[1:]) -> None:
+    args = parse_args(argv)
 
     # Rearrange pages
     pagerange = parserange(args.pages) if args.pages is not None else None
     paper_context = PaperContext()
     specs, modulo, flipping = parsespecs("0", paper_context)
     with file_transform(
-        args.infile, args.outfile, None, None, specs, 0, False
+        args.infile,
+        args.outfile,
+        None,
+        None,
+        specs,
+        0,
+        False,
+        output_options(args),
+        args.split,
     ) as transform:
         transform.transform_pages(
             pagerange, flipping, args.reverse, args.odd, args.even, modulo, args.verbose
         )
 
 
+# Make a pipeline stage from psselect arguments.
+def psselect_stage(argv: list[str]) -> Stage:
+    args = parse_args(argv)
+    check_stage_args(args)
+    pagerange = parserange(args.pages) if args.pages is not None else None
+
+    def stage(total_pages: int, in_size: Rectangle) -> StagePlan:
+        return StagePlan(
+            page_plan(
+                total_pages,
+                [[PageSpec()]],
+                pagerange,
+                args.reverse,
+                args.odd,
+                args.even,
+                1,
+            ),
+            in_size,
+            None,
+        )
+
+    return stage
+
+
 if __name__ == "__main__":
     psselect()
@@ -14,15 +14,20 @@ from psutils.argparse import (
     PaperContext,
     add_draw_argument,
     add_file_arguments,
+    add_output_arguments,
     add_paper_arguments,
     add_quiet_and_help_arguments,
+    add_split_argument,
     add_version_argument,
+    output_options,
     parserange,
+    parsesection,
     parsespecs,
 )
-from psutils.transformers import file_transform
-from psutils.types import Rectangle
-from psutils.warnings import simple_warning
+from psutils.pipeline import Stage, StagePlan, check_stage_args
+from psutils.transformers import file_transform, sections_plan
+from psutils.types import Rectangle, SpecSection
+from psutils.warnings import die, simple_warning
 
 
 DEFAULT_SPECS = "0"
@@ -41,6 +46,10 @@ PAGES is a comma-separated list of pages and page ranges.
 
 SPECS is a list of page specifications [default is "{DEFAULT_SPECS}", which selects
 each page in its normal order].
+
+With --section, the pages of each section are output in turn, rearranged
+by that section's SPECS; --even, --odd and --reverse apply within each
+section.
 """,
     )
     warnings.showwarning = simple_warning(parser.prog)
@@ -59,6 +68,16 @@ each page in its normal order].
         type=parserange,
         help="select the given page ranges",
     )
+    parser.add_argument(
+        "--section",
+        metavar="PAGES=SPECS",
+        type=parsesection,
+        action="append",
+        help="""\
+rearrange the given page ranges with the given
+page specifications; may be repeated, to treat
+several parts of the document differently""",
+    )
     parser.add_argument(
         "-e",
         "--even",
@@ -79,6 +98,8 @@ each page in its normal order].
     )
     add_paper_arguments(parser)
     add_draw_argument(parser, paper_context)
+    add_output_arguments(parser)
+    add_split_argument(parser)
     parser.add_argument("-b", "--nobind", help=argparse.SUPPRESS)
     add_version_argument(parser)
     add_quiet_and_help_arguments(parser)
@@ -101,22 +122,41 @@ def spec_exception() -> NoReturn:
     raise SpecsException("invalid specs")
 
 
-def pstops(argv: list[str] = sys.argv[1:]) -> None:
+# Parse the arguments, returning them with the output and input page sizes
+# given, the sections of the document to rearrange, and whether pages are
+# flipped.
+def parse_args(
+    argv: list[str],
+) -> tuple[
+    argparse.Namespace,
+    Rectangle | None,
+    Rectangle | None,
+    list[SpecSection],
+    bool,
+]:
     parser, paper_context = get_parser()
     args = parser.parse_intermixed_args(argv)
 
-    # Get specs if we don't have them yet
-    if args.specs is None:
-        if args.infile is None:
-            args.specs = "-"
-        else:
-            args.specs = args.infile
-        try:
-            parsespecs(args.specs, paper_context, err_function=spec_exception)
-            args.infile = args.outfile
-            args.outfile = args.specs_alt
-        except SpecsException:
-            args.specs = DEFAULT_SPECS
+    if args.section is not None and (
+        args.specs is not None or args.pagerange is not None
+    ):
+        die("--section cannot be used with --specs or --pages")
+
+    section_args = args.section
+    if section_args is None:
+        # Get specs if we don't have them yet
+        if args.specs is None:
+            if args.infile is None:
+                args.specs = "-"
+            else:
+                args.specs = args.infile
+            try:
+                parsespecs(args.specs, paper_context, err_function=spec_exception)
+                args.infile = args.outfile
+                args.outfile = args.specs_alt
+            except SpecsException:
+                args.specs = DEFAULT_SPECS
+        section_args = [(args.pagerange, args.specs)]
 
     size: Rectangle | None = None
     in_size: Rectangle | None = None
@@ -130,27 +170,52 @@ def pstops(argv: list[str] = sys.argv[1:]) -> None:
         in_size = Rectangle(args.inwidth, args.inheight)
     if size:
         paper_context = PaperContext(size)
-    specs, modulo, flipping = parsespecs(args.specs, paper_context)
+    sections = []
+    flipping = False
+    for pagerange, specs_text in section_args:
+        specs, modulo, section_flipping = parsespecs(specs_text, paper_context)
+        sections.append(SpecSection(pagerange, specs, modulo))
+        flipping = flipping or section_flipping
+    return args, size, in_size, sections, flipping
+
 
+def pstops(argv: list[str] = sys.argv[1:]) -> None:
+    args, size, in_size, sections, flipping = parse_args(argv)
     with file_transform(
         args.infile,
         args.outfile,
         size,
         in_size,
-        specs,
+        sections[0].specs,
         args.draw,
         False,
+        output_options(args),
+        args.split,
     ) as transform:
-        transform.transform_pages(
-            args.pagerange,
+        transform.transform_sections(
+            sections,
             flipping,
             args.reverse,
             args.odd,
             args.even,
-            modulo,
             args.verbose,
         )
 
 
+# Make a pipeline stage from pstops arguments.
+def pstops_stage(argv: list[str]) -> Stage:
+    args, size, stage_in_size, sections, _ = parse_args(argv)
+    check_stage_args(args)
+
+    def stage(total_pages: int, in_size: Rectangle) -> StagePlan:
+        return StagePlan(
+            sections_plan(total_pages, sections, args.reverse, args.odd, args.even),
+            stage_in_size if stage_in_size is not None else in_size,
+            size,
+        )
+
+    return stage
+
+
 if __name__ == "__main__":
     pstops()
@@ -0,0 +1,181 @@
+"""psutils command.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import argparse
+import shlex
+import sys
+import warnings
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from psutils.argparse import (
+    HelpFormatter,
+    add_basic_arguments,
+    add_output_arguments,
+    add_version_argument,
+    output_options,
+)
+from psutils.command.psbook import psbook_stage
+from psutils.command.psnup import psnup_stage
+from psutils.command.psresize import psresize_stage
+from psutils.command.psselect import psselect_stage
+from psutils.command.pstops import pstops_stage
+from psutils.pipeline import Stage, Target, run_fanout, run_pipeline
+from psutils.warnings import die, simple_warning
+
+
+# The commands that can be used as pipeline stages
+stage_commands: dict[str, Callable[[list[str]], Stage]] = {
+    "psbook": psbook_stage,
+    "psnup": psnup_stage,
+    "psresize": psresize_stage,
+    "psselect": psselect_stage,
+    "pstops": pstops_stage,
+}
+
+
+# Make a pipeline stage from a command line, such as `psnup -2'.
+def pipeline_stage(command: str) -> Stage:
+    words = shlex.split(command)
+    if len(words) == 0 or words[0] not in stage_commands:
+        die(
+            f"`{command}' is not a pipeline stage; "
+            f"stages can use {', '.join(stage_commands)}"
+        )
+    return stage_commands[words[0]](words[1:])
+
+
+# The outputs of a fan-out, each given as its file name and the commands
+# of its stages, are collected in `targets'. `--target FILE' starts a new
+# output; `--stage COMMAND' adds a stage to the last one. Stages given
+# before any `--target' make the output named by OUTFILE.
+class TargetAction(argparse.Action):
+    def __call__(
+        self,
+        parser: argparse.ArgumentParser,
+        namespace: argparse.Namespace,
+        values: str | Sequence[Any] | None,
+        option_string: str | None = None,
+    ) -> None:
+        targets: list[tuple[Any, list[Any]]] | None = getattr(namespace, self.dest)
+        if targets is None:
+            targets = [(None, [])]
+        if option_string in ("-t", "--target"):
+            targets.append((values, []))
+        else:
+            targets[-1][1].append(values)
+        setattr(namespace, self.dest, targets)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    # Command-line arguments
+    parser = argparse.ArgumentParser(
+        description="Run PSUtils operations.",
+        formatter_class=HelpFormatter,
+        usage="%(prog)s COMMAND ...",
+        add_help=False,
+    )
+    warnings.showwarning = simple_warning(parser.prog)
+
+    # Command-line parser
+    add_version_argument(parser)
+    parser.add_argument(
+        "--help",
+        action="help",
+        help="show this help message and exit",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    pipeline = subparsers.add_parser(
+        "pipeline",
+        prog=f"{parser.prog} pipeline",
+        description="Run a chain of page rearrangements in one pass.",
+        help="run a chain of page rearrangements in one pass",
+        formatter_class=HelpFormatter,
+        usage="%(prog)s [OPTION...] -e COMMAND... [INFILE [OUTFILE]]",
+        add_help=False,
+        epilog=f"""
+Each COMMAND is a command line, without file names or output options, of
+one of {", ".join(stage_commands)}. The commands are applied
+in order, as if the output of each were passed to the next, but the
+input is read once and the output written once.
+""",
+    )
+    pipeline.add_argument(
+        "-e",
+        "--stage",
+        metavar="COMMAND",
+        action="append",
+        required=True,
+        help="add a stage to the pipeline",
+    )
+    add_output_arguments(pipeline)
+    add_basic_arguments(pipeline)
+    fanout = subparsers.add_parser(
+        "fanout",
+        prog=f"{parser.prog} fanout",
+        description="Make several outputs from one input in one pass.",
+        help="make several outputs from one input in one pass",
+        formatter_class=HelpFormatter,
+        usage="%(prog)s [OPTION...] [-e COMMAND...] [-t FILE -e COMMAND...]... "
+        "[INFILE [OUTFILE]]",
+        add_help=False,
+        epilog=f"""
+Each COMMAND is a command line, without file names or output options, of
+one of {", ".join(stage_commands)}. The commands given
+after each --target make a pipeline that writes that FILE; those given
+before any --target write OUTFILE. The input is read once, and the
+outputs are written concurrently.
+""",
+    )
+    fanout.add_argument(
+        "-t",
+        "--target",
+        metavar="FILE",
+        dest="targets",
+        action=TargetAction,
+        help="start an output written to FILE",
+    )
+    fanout.add_argument(
+        "-e",
+        "--stage",
+        metavar="COMMAND",
+        dest="targets",
+        action=TargetAction,
+        help="add a stage to the pipeline of the last output",
+    )
+    add_output_arguments(fanout)
+    add_basic_arguments(fanout)
+
+    return parser
+
+
+def psutils(argv: list[str] = sys.argv[1:]) -> None:
+    args = get_parser().parse_args(argv)
+
+    if args.command == "pipeline":
+        stages = [pipeline_stage(command) for command in args.stage]
+        run_pipeline(
+            args.infile, args.outfile, stages, output_options(args), args.verbose
+        )
+    elif args.command == "fanout":
+        targets = []
+        for outfile_name, commands in args.targets or [(None, [])]:
+            if outfile_name is None:
+                if len(commands) == 0 and args.outfile is None:
+                    continue
+                outfile_name = args.outfile
+            if len(commands) == 0:
+                die(f"no stages given for output {outfile_name or '-'}")
+            targets.append(
+                Target(outfile_name, [pipeline_stage(command) for command in commands])
+            )
+        if len(targets) == 0:
+            die("no outputs given")
+        run_fanout(args.infile, targets, output_options(args), args.verbose)
+
+
+if __name__ == "__main__":
+    psutils()
@@ -0,0 +1,94 @@
+"""PSUtils PDF engines.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from importlib import import_module
+from typing import IO, TYPE_CHECKING, Any, Protocol
+
+from .types import Rectangle, TransformOptions
+from .warnings import die
+
+
+if TYPE_CHECKING:
+    from .transformers import DocumentTransform
+
+
+# The interface of the documents read by a PDF engine
+class PdfDocument(Protocol):
+    @property
+    def size(self) -> Rectangle | None: ...
+
+    @property
+    def size_guessed(self) -> bool: ...
+
+    def get_num_pages(self) -> int: ...
+
+
+# A library used to read, transform and write PDF documents.
+# `transform' is called with the arguments of PdfTransform, and `join' with
+# the input files, the output file, whether to make each input document's
+# number of pages even, and the output options.
+@dataclass
+class PdfEngine:
+    name: str
+    reader: Callable[[IO[bytes]], PdfDocument]
+    transform: Callable[..., "DocumentTransform"]
+    join: Callable[[list[IO[bytes]], IO[bytes], bool, TransformOptions], None]
+    # Whether the engine can apply the given output options and draw
+    # borders of the given width
+    supports: Callable[[TransformOptions, float], bool]
+
+
+# The modules that register each engine, in order of preference. An engine
+# is only available if its module can be imported. pypdf supports all the
+# options, so it is used unless another engine is asked for.
+pdf_engine_modules = {
+    "pypdf": "psutils.transformers",
+    "pikepdf": "psutils.pikepdf_engine",
+}
+
+pdf_engines: dict[str, PdfEngine] = {}
+
+
+def register_pdf_engine(engine: PdfEngine) -> None:
+    pdf_engines[engine.name] = engine
+
+
+def load_pdf_engine(name: str) -> PdfEngine | None:
+    if name not in pdf_engines:
+        try:
+            import_module(pdf_engine_modules[name])
+        except ImportError:
+            return None
+    return pdf_engines.get(name)
+
+
+# Return the named engine, or, if `name' is None, the first available
+# engine that supports the options.
+def pdf_engine(
+    name: str | None, options: TransformOptions, draw: float = 0
+) -> PdfEngine:
+    if name is not None:
+        engine = load_pdf_engine(name)
+        if engine is None:
+            die(f"PDF engine `{name}' is not available")
+        if not engine.supports(options, draw):
+            die(f"PDF engine `{name}' does not support the options given")
+        return engine
+    for engine_name in pdf_engine_modules:
+        engine = load_pdf_engine(engine_name)
+        if engine is not None and engine.supports(options, draw):
+            return engine
+    die("no PDF engine supports the options given")
+
+
+# Return the engine that read `doc', if any.
+def document_engine(doc: Any) -> PdfEngine | None:
+    for engine in pdf_engines.values():
+        if isinstance(engine.reader, type) and isinstance(doc, engine.reader):
+            return engine
+    return None
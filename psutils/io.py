@@ -16,40 +16,49 @@ import puremagic
 from .warnings import die
 
 
+# Read an input file, or standard input for None or `-', into a seekable
+# file, and return it with its MIME type.
+def read_input(infile_name: str | None) -> tuple[io.BytesIO, str]:
+    infile: IO[bytes]
+    if infile_name is None or infile_name == "-":
+        infile = os.fdopen(sys.stdin.fileno(), "rb", closefd=False)
+    else:
+        try:
+            infile = open(infile_name, "rb")
+        except OSError:
+            die(f"cannot open input file {infile_name}")
+
+    # Find MIME type of input
+    data = infile.read(16)
+    file_type = puremagic.from_string(data)
+
+    # Slurp infile into a seekable BytesIO
+    seekable_infile = io.BytesIO(data + infile.read())
+    infile.close()
+    return seekable_infile, file_type
+
+
+# Open an output file, or standard output for None or `-'.
+def open_output(outfile_name: str | None) -> IO[bytes]:
+    if outfile_name is None or outfile_name == "-":
+        return os.fdopen(sys.stdout.fileno(), "wb", closefd=False)
+    try:
+        return open(outfile_name, "wb")
+    except OSError:
+        die(f"cannot open output file {outfile_name}")
+
+
 @contextmanager
 def setup_inputs_and_output(
     infile_names: list[str | None], outfile_name: str | None
 ) -> Iterator[tuple[list[tuple[IO[bytes], str]], IO[bytes]]]:
     # Set up inputs
-    seekable_infiles: list[tuple[IO[bytes], str]] = []
-    for infile_name in infile_names:
-        infile: IO[bytes]
-        if infile_name is None or infile_name == "-":
-            infile = os.fdopen(sys.stdin.fileno(), "rb", closefd=False)
-        else:
-            try:
-                infile = open(infile_name, "rb")
-            except OSError:
-                die(f"cannot open input file {infile_name}")
-
-        # Find MIME type of input
-        data = infile.read(16)
-        file_type = puremagic.from_string(data)
-
-        # Slurp infile into a seekable BytesIO
-        seekable_infile = io.BytesIO(data + infile.read())
-        infile.close()
-
-        seekable_infiles.append((seekable_infile, file_type))
+    seekable_infiles: list[tuple[IO[bytes], str]] = [
+        read_input(infile_name) for infile_name in infile_names
+    ]
 
     # Set up output
-    if outfile_name is None or outfile_name == "-":
-        outfile = os.fdopen(sys.stdout.fileno(), "wb", closefd=False)
-    else:
-        try:
-            outfile = open(outfile_name, "wb")
-        except OSError:
-            die(f"cannot open output file {outfile_name}")
+    outfile = open_output(outfile_name)
 
     # Context manager
     try:
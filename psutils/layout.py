@@ -0,0 +1,159 @@
+"""PSUtils page layout.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import math
+from copy import copy
+from typing import Any
+
+from .types import Offset, PageSpec, Rectangle
+from .warnings import die
+
+
+# Return the divisors of `n' in increasing order, finding them in pairs
+# up to the square root of `n'.
+def divisors(n: int) -> list[int]:
+    small = [d for d in range(1, math.isqrt(n) + 1) if n % d == 0]
+    return small + [n // d for d in reversed(small) if n // d != d]
+
+
+# The layouts worked out so far, by their arguments
+nup_layouts: dict[tuple[Any, ...], list[PageSpec]] = {}
+
+
+# Lay out `nup' input pages of size `in_size' on an output page of size
+# `size', with a margin of `margin' around the output page and a border of
+# `border' around each input page, and return the spec of each cell.
+# Cells are filled in rows if `rowmajor' is set, otherwise in columns,
+# from the left if `leftright' is set and from the top if `topbottom' is
+# set. Each grid of columns and rows that `nup' divides into is tried in
+# both orientations, and the one that wastes least space is used; if none
+# wastes less than `tolerance' square points, it is an error.
+def nup_layout(
+    nup: int,
+    size: Rectangle,
+    in_size: Rectangle,
+    margin: float,
+    border: float,
+    tolerance: float,
+    rowmajor: bool,
+    leftright: bool,
+    topbottom: bool,
+) -> list[PageSpec]:
+    key = (
+        nup,
+        size.width,
+        size.height,
+        in_size.width,
+        in_size.height,
+        margin,
+        border,
+        tolerance,
+        rowmajor,
+        leftright,
+        topbottom,
+    )
+    if key not in nup_layouts:
+        nup_layouts[key] = layout_cells(
+            nup,
+            size,
+            in_size,
+            margin,
+            border,
+            tolerance,
+            rowmajor,
+            leftright,
+            topbottom,
+        )
+    # Return copies of the cached specs, so that callers may change them.
+    return [copy(spec) for spec in nup_layouts[key]]
+
+
+# Work out a layout for nup_layout.
+def layout_cells(
+    nup: int,
+    size: Rectangle,
+    in_size: Rectangle,
+    margin: float,
+    border: float,
+    tolerance: float,
+    rowmajor: bool,
+    leftright: bool,
+    topbottom: bool,
+) -> list[PageSpec]:
+    # Calculate paper dimensions, subtracting paper margin from height & width
+    ppwid, pphgt = size.width - margin * 2, size.height - margin * 2
+    if ppwid <= 0 or pphgt <= 0:
+        die("margin is too large")
+    if border > min(ppwid, pphgt):
+        die("border is too large")
+
+    # The wasted space of `hor' by `ver' pages of the given size
+    def waste(hor: int, ver: int, iwid: float, ihgt: float) -> float:
+        scl = min(pphgt / (ihgt * ver), ppwid / (iwid * hor))
+        return (ppwid - scl * iwid * hor) ** 2 + (pphgt - scl * ihgt * ver) ** 2
+
+    # Find the grid that wastes least space, trying the normal orientation
+    # before the rotated one, and grids with fewer columns first.
+    best = tolerance
+    horiz, vert, rotate = 0, 0, False
+    for hor in divisors(nup):
+        ver = nup // hor
+        for cols, rows, iwid, ihgt, rot in (
+            (hor, ver, in_size.width, in_size.height, False),
+            (ver, hor, in_size.height, in_size.width, True),
+        ):
+            cell_waste = waste(cols, rows, iwid, ihgt)
+            if cell_waste < best:
+                best, horiz, vert, rotate = cell_waste, cols, rows, rot
+
+    # Fail if nothing better than tolerance was found
+    if best == tolerance:
+        die(f"can't find acceptable layout for {nup}-up")
+
+    # Take account of rotation
+    width, height = in_size.width, in_size.height
+    if rotate:
+        topbottom, leftright, rowmajor, width, height = (
+            not leftright,
+            topbottom,
+            not rowmajor,
+            height,
+            width,
+        )
+
+    # Calculate page scale, allowing for internal borders
+    scale = min(
+        (pphgt - 2 * border * vert) / (height * vert),
+        (ppwid - 2 * border * horiz) / (width * horiz),
+    )
+
+    # Page centring shifts
+    hshift = (ppwid / horiz - width * scale) / 2
+    vshift = (pphgt / vert - height * scale) / 2
+
+    # The position of each column and row, in the order they are filled
+    cell_width, cell_height = ppwid / horiz, pphgt / vert
+    columns = range(horiz) if leftright else range(horiz - 1, -1, -1)
+    rows = range(vert - 1, -1, -1) if topbottom else range(vert)
+    if rotate:
+        xoffs = [margin + (across + 1) * cell_width - hshift for across in columns]
+    else:
+        xoffs = [margin + across * cell_width + hshift for across in columns]
+    yoffs = [margin + up * cell_height + vshift for up in rows]
+
+    # Make the spec of each cell
+    return [
+        PageSpec(
+            pageno=page,
+            rotate=90 if rotate else 0,
+            scale=scale,
+            off=Offset(
+                xoffs[page % horiz if rowmajor else page // vert],
+                yoffs[page // horiz if rowmajor else page % vert],
+            ),
+        )
+        for page in range(nup)
+    ]
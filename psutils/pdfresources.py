@@ -0,0 +1,305 @@
+"""PSUtils utilities for dealing with PDF page resources.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import hashlib
+import io
+import math
+import zlib
+from collections.abc import Callable
+from typing import Any, cast
+
+from pypdf import PageObject, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    RectangleObject,
+    StreamObject,
+)
+
+from .warnings import die
+
+
+# Resource categories whose entries content streams refer to by name.
+# Entries in any other category (e.g. /ProcSet) are always kept.
+named_resources = (
+    "/ExtGState",
+    "/ColorSpace",
+    "/Pattern",
+    "/Shading",
+    "/XObject",
+    "/Font",
+    "/Properties",
+)
+
+# Operators whose first operand names a resource
+resource_operators = {
+    b"Do": "/XObject",
+    b"Tf": "/Font",
+    b"gs": "/ExtGState",
+    b"cs": "/ColorSpace",
+    b"CS": "/ColorSpace",
+    b"sh": "/Shading",
+}
+
+
+def add_name(used: dict[str, set[str]], category: str, name: Any) -> bool:
+    if not isinstance(name, NameObject) or name in used[category]:
+        return False
+    used[category].add(name)
+    return True
+
+
+# Add the names of the resources used by `content' to `used'.
+# Form XObjects without resources of their own use those of the page, so
+# their content is scanned too.
+def content_resources(
+    content: ContentStream | None,
+    resources: DictionaryObject,
+    used: dict[str, set[str]],
+) -> None:
+    if content is None:
+        return
+    for operands, operator in content.operations:
+        if operator == b"INLINE IMAGE":
+            settings = operands["settings"]
+            add_name(
+                used, "/ColorSpace", settings.get("/CS", settings.get("/ColorSpace"))
+            )
+        elif operator in (b"scn", b"SCN") and len(operands) > 0:
+            add_name(used, "/Pattern", operands[-1])
+        elif operator in (b"BDC", b"DP") and len(operands) > 1:
+            add_name(used, "/Properties", operands[1])
+        elif operator in resource_operators and len(operands) > 0:
+            category = resource_operators[operator]
+            if add_name(used, category, operands[0]) and category == "/XObject":
+                xobjects = resources.get("/XObject", DictionaryObject()).get_object()
+                xobject = xobjects.get(operands[0])
+                if xobject is None:
+                    continue
+                xobject = xobject.get_object()
+                if (
+                    isinstance(xobject, StreamObject)
+                    and xobject.get("/Subtype") == "/Form"
+                    and "/Resources" not in xobject
+                ):
+                    content_resources(
+                        ContentStream(xobject, content.pdf), resources, used
+                    )
+
+
+# Return a copy of `page' without the named resources that its content does
+# not use. The original page and its resources are not modified, as the
+# resource dictionary is often shared between all the pages of a document.
+def prune_resources(page: PageObject) -> PageObject:
+    if "/Resources" not in page:
+        return page
+    resources = cast(DictionaryObject, page["/Resources"].get_object())
+    used: dict[str, set[str]] = {category: set() for category in named_resources}
+    content_resources(page.get_contents(), resources, used)
+    pruned = DictionaryObject()
+    for category, value in resources.items():
+        if category in named_resources:
+            kept = DictionaryObject(
+                (name, obj)
+                for name, obj in cast(DictionaryObject, value.get_object()).items()
+                if name in used[category]
+            )
+            if len(kept) > 0:
+                pruned[NameObject(category)] = kept
+        else:
+            pruned[NameObject(category)] = value
+    new_page = PageObject(page.pdf, page.indirect_reference)
+    new_page.update(page)
+    new_page[NameObject("/Resources")] = pruned
+    return new_page
+
+
+# Find the largest size at which each image XObject of a page is drawn, in
+# default user space units.
+def image_sizes(page: PageObject) -> dict[str, tuple[float, float]]:
+    sizes: dict[str, tuple[float, float]] = {}
+    content = page.get_contents()
+    if content is None or "/Resources" not in page:
+        return sizes
+    resources = cast(DictionaryObject, page["/Resources"].get_object())
+    xobjects = cast(
+        DictionaryObject, resources.get("/XObject", DictionaryObject()).get_object()
+    )
+    ctm = (1.0, 0.0, 0.0, 1.0)
+    stack = []
+    for operands, operator in content.operations:
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q" and len(stack) > 0:
+            ctm = stack.pop()
+        elif operator == b"cm" and len(operands) == 6:
+            a, b, c, d = (float(x) for x in operands[:4])
+            ctm = (
+                a * ctm[0] + b * ctm[2],
+                a * ctm[1] + b * ctm[3],
+                c * ctm[0] + d * ctm[2],
+                c * ctm[1] + d * ctm[3],
+            )
+        elif operator == b"Do" and len(operands) > 0:
+            xobject = xobjects.get(operands[0])
+            if xobject is not None and xobject.get_object().get("/Subtype") == "/Image":
+                width, height = math.hypot(ctm[0], ctm[1]), math.hypot(ctm[2], ctm[3])
+                old_width, old_height = sizes.get(operands[0], (0.0, 0.0))
+                sizes[operands[0]] = (max(width, old_width), max(height, old_height))
+    return sizes
+
+
+# Images that can be resampled: those in gray or RGB with 8 bits per
+# component, no masks and no decode array.
+def can_resample(image: StreamObject) -> bool:
+    if (
+        image.get("/BitsPerComponent") != 8
+        or image.get("/ImageMask", False)
+        or any(key in image for key in ("/SMask", "/Mask", "/Decode"))
+    ):
+        return False
+    colorspace = image.get("/ColorSpace")
+    if colorspace is None:
+        return False
+    colorspace = colorspace.get_object()
+    if colorspace in ("/DeviceGray", "/DeviceRGB"):
+        return True
+    return (
+        isinstance(colorspace, list)
+        and len(colorspace) == 2
+        and colorspace[0] == "/ICCBased"
+        and colorspace[1].get_object().get("/N") in (1, 3)
+    )
+
+
+# Return a copy of `image' resampled to the given size. JPEG images are
+# re-encoded as JPEG; all others are compressed losslessly.
+def resample_image(image: StreamObject, width: int, height: int) -> StreamObject:
+    try:
+        from PIL import Image
+    except ImportError:
+        die("Pillow is required to resample images")
+    img = image.decode_as_image()
+    img = img.convert("L" if img.mode in ("1", "L") else "RGB")
+    img = img.resize((width, height), Image.Resampling.LANCZOS)
+    resampled = DecodedStreamObject()
+    for key in ("/Type", "/Subtype", "/ColorSpace", "/BitsPerComponent", "/Intent"):
+        if key in image:
+            resampled[NameObject(key)] = image[key]
+    resampled[NameObject("/Width")] = NumberObject(width)
+    resampled[NameObject("/Height")] = NumberObject(height)
+    if image.get("/Filter") in ("/DCTDecode", ["/DCTDecode"]):
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        resampled[NameObject("/Filter")] = NameObject("/DCTDecode")
+        resampled.set_data(buf.getvalue())
+    else:
+        resampled[NameObject("/Filter")] = NameObject("/FlateDecode")
+        resampled.set_data(zlib.compress(img.tobytes()))
+    return resampled
+
+
+# Return a copy of `page' in which the images that would have a resolution
+# higher than `dpi' when the page is drawn at the given scale are replaced by
+# resampled versions. `derive' is called to resample an image to a given
+# size, and returns a reference to the new image.
+def downsample_images(
+    page: PageObject,
+    scale: float,
+    dpi: float,
+    derive: Callable[[IndirectObject, int, int], IndirectObject],
+) -> PageObject:
+    sizes = image_sizes(page)
+    if len(sizes) == 0:
+        return page
+    resources = DictionaryObject(
+        cast(DictionaryObject, page["/Resources"].get_object())
+    )
+    xobjects = DictionaryObject(
+        cast(DictionaryObject, resources["/XObject"].get_object())
+    )
+    for name, (width, height) in sizes.items():
+        ref = xobjects.raw_get(name)
+        image = cast(StreamObject, ref.get_object())
+        if not isinstance(ref, IndirectObject) or not can_resample(image):
+            continue
+        # Size in pixels at the target resolution
+        new_width = math.ceil(width * scale * dpi / 72)
+        new_height = math.ceil(height * scale * dpi / 72)
+        if new_width < cast(int, image["/Width"]) and new_height < cast(
+            int, image["/Height"]
+        ):
+            xobjects[NameObject(name)] = derive(ref, new_width, new_height)
+    resources[NameObject("/XObject")] = xobjects
+    new_page = PageObject(page.pdf, page.indirect_reference)
+    new_page.update(page)
+    new_page[NameObject("/Resources")] = resources
+    return new_page
+
+
+# Return a hash of everything that determines how `page' is drawn, so that
+# pages with the same hash can share their content, or None if the page
+# has annotations, which would not be shared. Resources are hashed by
+# reference, so only pages that use the same resources match.
+def content_key(page: PageObject) -> bytes | None:
+    if "/Annots" in page:
+        return None
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    digest.update(repr(list(page.mediabox)).encode())
+    for key in ("/CropBox", "/TrimBox", "/Rotate"):
+        if key in page:
+            digest.update(f"{key} {page[key]!r}".encode())
+    if "/Resources" in page:
+        resources = io.BytesIO()
+        page.raw_get("/Resources").write_to_stream(resources)
+        digest.update(resources.getvalue())
+    return digest.digest()
+
+
+# Return a page that draws `page' as a Form XObject added to `writer', so
+# that each use of the page refers to the same copy of its content. Like
+# the page, the form and the page that draws it are clipped to the page's
+# crop box.
+def form_page(page: PageObject, writer: PdfWriter) -> PageObject:
+    # Read the crop box directly, as pypdf's accessor adds it to the page.
+    cropbox = (
+        RectangleObject(cast(ArrayObject, page["/CropBox"]))
+        if "/CropBox" in page
+        else page.mediabox
+    )
+    form = DecodedStreamObject()
+    contents = page.get_contents()
+    form.set_data(contents.get_data() if contents is not None else b"")
+    form.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): cropbox,
+        }
+    )
+    if "/Resources" in page:
+        form[NameObject("/Resources")] = page.raw_get("/Resources")
+    ref = writer._add_object(form.clone(writer))
+    stamp = PageObject.create_blank_page(
+        None, page.mediabox.width, page.mediabox.height
+    )
+    stamp.mediabox = page.mediabox
+    stamp.cropbox = cropbox
+    stamp[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/XObject"): DictionaryObject({NameObject("/PStoPSForm"): ref})}
+    )
+    draw = DecodedStreamObject()
+    draw.set_data(b"/PStoPSForm Do")
+    stamp[NameObject("/Contents")] = draw
+    return stamp
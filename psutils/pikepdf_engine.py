@@ -0,0 +1,254 @@
+"""PSUtils PDF engine using pikepdf (qpdf).
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import io
+from typing import IO, Any
+
+import pikepdf  # type: ignore
+from pikepdf import Dictionary, ObjectStreamMode, Pdf, StreamDecodeLevel  # type: ignore
+
+from .engines import PdfEngine, register_pdf_engine
+from .transformers import DocumentTransform, spec_transformation
+from .types import (
+    Box,
+    ImpositionPlan,
+    PageBoxes,
+    PageGeometry,
+    PageSpec,
+    Rectangle,
+    TransformOptions,
+)
+from .warnings import die
+
+
+# Get an attribute of a page, which may be inherited from the page tree.
+def inherited(page: pikepdf.Dictionary, name: str, default: Any) -> Any:
+    node = page
+    while node is not None:
+        if name in node:
+            return node[name]
+        node = node.get("/Parent")
+    return default
+
+
+class PikePdfReader:
+    def __init__(self, file: IO[bytes]) -> None:
+        try:
+            self.pdf = Pdf.open(file)
+        except pikepdf.PdfError as e:
+            die(f"could not read PDF document: {e}")
+        assert len(self.pdf.pages) > 0
+        mediabox = self.pdf.pages[0].mediabox
+        self.size = Rectangle(
+            float(mediabox[2] - mediabox[0]), float(mediabox[3] - mediabox[1])
+        )
+        self.size_guessed = False
+        self.geometry = PageGeometry(len(self.pdf.pages), self.read_page_geometry)
+
+    def get_num_pages(self) -> int:
+        return len(self.pdf.pages)
+
+    # Read the geometry of a page for the geometry index.
+    def read_page_geometry(self, page_number: int) -> PageBoxes:
+        page = self.pdf.pages[page_number]
+
+        def box(rectangle: pikepdf.Array) -> Box:
+            left, bottom, right, top = (float(x) for x in rectangle)
+            return (
+                min(left, right),
+                min(bottom, top),
+                max(left, right),
+                max(bottom, top),
+            )
+
+        return PageBoxes(
+            box(page.mediabox),
+            box(page.cropbox),
+            box(page.trimbox),
+            None,
+            int(inherited(page.obj, "/Rotate", 0)),
+        )
+
+
+# Write a PDF document built with pikepdf according to the output options.
+def write_pikepdf_document(
+    pdf: Pdf, outfile: IO[bytes], options: TransformOptions, version: str
+) -> None:
+    level = options.compress_level
+    if level is not None:
+        pikepdf.settings.set_flate_compression_level(level)
+    # qpdf seeks, so write to a buffer first in case outfile is stdout.
+    buf = io.BytesIO()
+    try:
+        pdf.save(
+            buf,
+            min_version=version,
+            compress_streams=level is not None,
+            stream_decode_level=StreamDecodeLevel.none,
+            object_stream_mode=(
+                ObjectStreamMode.generate
+                if options.object_streams
+                else ObjectStreamMode.disable
+            ),
+        )
+    finally:
+        pikepdf.settings.set_flate_compression_level(-1)
+    outfile.write(buf.getvalue())
+    outfile.flush()
+
+
+class PikePdfTransform(DocumentTransform):
+    def __init__(
+        self,
+        reader: PikePdfReader,
+        outfile: IO[bytes],
+        size: Rectangle | None,
+        in_size: Rectangle | None,
+        specs: list[list[PageSpec]],
+        draw: float,
+        options: TransformOptions | None = None,
+        infile_name: str | None = None,
+    ):
+        super().__init__(options)
+        self.outfile = outfile
+        self.reader = reader
+        self.writer = Pdf.new()
+        self.specs = specs
+        self.draw = draw
+        # Input pages that are transformed are copied into the output once,
+        # as form XObjects.
+        self.forms: dict[int, pikepdf.Object] = {}
+
+        if in_size is None:
+            in_size = reader.size
+        if size is None:
+            size = in_size
+
+        self.size = size
+        self.in_size = in_size
+
+    def pages(self) -> int:
+        return len(self.reader.pdf.pages)
+
+    def chunk_transform(self, outfile: IO[bytes]) -> "PikePdfTransform":
+        return PikePdfTransform(
+            self.reader,
+            outfile,
+            self.size,
+            self.in_size,
+            self.specs,
+            self.draw,
+            self.options,
+        )
+
+    def page_size(self, n: int) -> Rectangle | None:
+        return self.reader.geometry.media_size(n)
+
+    def form(self, n: int) -> pikepdf.Object:
+        if n not in self.forms:
+            page = self.reader.pdf.pages[n]
+            self.forms[n] = self.writer.copy_foreign(
+                page.as_form_xobject(handle_transformations=False)
+            )
+        return self.forms[n]
+
+    def write_header(self, plan: ImpositionPlan) -> None:
+        pass
+
+    def write_page_comment(self, pagelabel: str, outputpage: int) -> None:
+        pass
+
+    def write_page(self, plan: ImpositionPlan, outputpage: int) -> None:
+        assert self.in_size
+        placements = plan.placements(outputpage)
+        if (
+            len(placements) == 1
+            and not placements[0].spec.has_transform()
+            and placements[0].page >= 0
+            and self.size == self.in_size
+            and (
+                self.in_size.width is None
+                or self.in_size == self.page_size(placements[0].page)
+            )
+        ):
+            self.writer.pages.append(self.reader.pdf.pages[placements[0].page])
+            return
+
+        # Add a blank page of the correct size, and place each input page on
+        # it as a form XObject
+        outpdf_page = self.writer.add_blank_page(
+            page_size=(self.size.width, self.size.height)
+        )
+        content = []
+        xobjects = Dictionary()
+        for i, (spec, real_page) in enumerate(placements):
+            if real_page >= 0:
+                xobjects[f"/Page{i}"] = self.form(real_page)
+                ctm = spec_transformation(spec, self.in_size).ctm
+                matrix = " ".join(f"{x:f}" for x in ctm)
+                content.append(f"q {matrix} cm /Page{i} Do Q\n".encode("ascii"))
+                outpdf_page.copy_annotations(
+                    self.reader.pdf.pages[real_page], pikepdf.Matrix(*ctm)
+                )
+        outpdf_page.obj.Resources = Dictionary(XObject=xobjects)
+        outpdf_page.obj.Contents = self.writer.make_stream(b"".join(content))
+
+    def finalize(self) -> None:
+        write_pikepdf_document(
+            self.writer, self.outfile, self.options, self.reader.pdf.pdf_version
+        )
+
+
+# Concatenate PDF documents, adding a blank page to each document with an
+# odd number of pages if `even' is set.
+def join_pdf(
+    infiles: list[IO[bytes]],
+    outfile: IO[bytes],
+    even: bool,
+    options: TransformOptions | None = None,
+) -> None:
+    options = options if options is not None else TransformOptions()
+    out_pdf = Pdf.new()
+    version = "1.3"
+    # The input documents must stay open until the output is written.
+    in_pdfs = []
+    for file in infiles:
+        in_pdf = PikePdfReader(file).pdf
+        in_pdfs.append(in_pdf)
+        out_pdf.pages.extend(in_pdf.pages)
+        if even and len(in_pdf.pages) % 2 == 1:
+            mediabox = in_pdf.pages[-1].mediabox
+            out_pdf.add_blank_page(
+                page_size=(
+                    float(mediabox[2] - mediabox[0]),
+                    float(mediabox[3] - mediabox[1]),
+                )
+            )
+        version = max(version, in_pdf.pdf_version)
+    write_pikepdf_document(out_pdf, outfile, options, version)
+
+
+# pikepdf is used for plain page copying and placement; the options that
+# need pypdf's page and resource handling are left to it.
+register_pdf_engine(
+    PdfEngine(
+        "pikepdf",
+        PikePdfReader,
+        PikePdfTransform,
+        join_pdf,
+        lambda options, draw: (
+            not (
+                options.prune_resources
+                or options.image_dpi is not None
+                or options.remove_duplicates
+                or options.dedupe_pages
+                or options.incremental
+                or options.jobs > 1
+                or draw > 0
+            )
+        ),
+    )
+)
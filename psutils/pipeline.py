@@ -0,0 +1,239 @@
+"""PSUtils pipelines.
+
+Run a chain of page rearrangements as a single transformation.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import argparse
+import io
+import math
+import sys
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, NamedTuple
+
+from .argparse import output_options
+from .engines import PdfDocument
+from .io import open_output, read_input, setup_input_and_output
+from .libpaper import get_paper_size
+from .readers import PsReader, document_reader
+from .transformers import document_transform, spec_transformation
+from .types import (
+    ImpositionPlan,
+    Offset,
+    PageSpec,
+    Placement,
+    Rectangle,
+    TransformOptions,
+)
+from .warnings import die
+
+
+# The plan made by a stage of a pipeline for its input pages, the size of
+# its input pages, and the size of its output pages, or None if it is
+# the same.
+class StagePlan(NamedTuple):
+    plan: ImpositionPlan
+    in_size: Rectangle
+    size: Rectangle | None
+
+
+# A stage of a pipeline is called with the number of pages and the page
+# size of its input, and returns its plan.
+Stage = Callable[[int, Rectangle], StagePlan]
+
+
+# Check the arguments of a command used as a pipeline stage, which reads
+# and writes pages rather than files.
+def check_stage_args(args: argparse.Namespace) -> None:
+    if args.infile is not None or args.outfile is not None:
+        die("file names cannot be given to the stages of a pipeline")
+    if getattr(args, "draw", 0) != 0:
+        die("borders cannot be drawn in a pipeline")
+    if output_options(args) != TransformOptions():
+        die("output options must be given to the pipeline, not to its stages")
+    if getattr(args, "split", None) is not None:
+        die("the output of a pipeline cannot be split by its stages")
+
+
+# Return the spec that has the same effect as placing a page of size
+# `in_size' according to `inner', and then placing the resulting page of
+# size `size' according to `outer'.
+def compose_specs(
+    outer: PageSpec, size: Rectangle, inner: PageSpec, in_size: Rectangle
+) -> PageSpec:
+    t = spec_transformation(inner, in_size).transform(spec_transformation(outer, size))
+    a, b, c, d, e, f = t.ctm
+    spec = PageSpec()
+    # A reflection is made by flipping the page horizontally first.
+    if a * d - b * c < 0:
+        spec.hflip = True
+        a, b = -a, -b
+        e, f = e - a * in_size.width, f - b * in_size.width
+    spec.rotate = round(math.degrees(math.atan2(b, a))) % 360
+    spec.scale = math.hypot(a, b)
+    spec.off = Offset(e, f)
+    return spec
+
+
+# Return the plan that places the input pages of `inner' according to
+# `inner' and then `outer'.
+def compose_plans(outer: StagePlan, inner: StagePlan) -> ImpositionPlan:
+    def pages() -> list[list[tuple[Placement, int]]]:
+        composed_pages = []
+        for outputpage in range(1, outer.plan.num_pages() + 1):
+            placements = []
+            for (spec, page), _ in outer.plan.labelled_placements(outputpage):
+                if page < 0:
+                    placements.append((Placement(spec, -1), -1))
+                    continue
+                for (
+                    inner_spec,
+                    inner_page,
+                ), label_page in inner.plan.labelled_placements(page + 1):
+                    placements.append(
+                        (
+                            Placement(
+                                compose_specs(
+                                    spec, outer.in_size, inner_spec, inner.in_size
+                                ),
+                                inner_page,
+                            ),
+                            label_page,
+                        )
+                    )
+            composed_pages.append(placements)
+        return composed_pages
+
+    return ImpositionPlan.from_placements(pages())
+
+
+# Plan the stages of a pipeline applied to a document of `total_pages'
+# pages of size `in_size', returning the combined plan.
+def pipeline_plan(
+    stages: list[Stage], total_pages: int, in_size: Rectangle
+) -> StagePlan:
+    if len(stages) == 0:
+        die("a pipeline must have at least one stage")
+    combined = stages[0](total_pages, in_size)
+    for stage in stages[1:]:
+        stage_plan = stage(
+            combined.plan.num_pages(),
+            combined.size if combined.size is not None else combined.in_size,
+        )
+        combined = StagePlan(
+            compose_plans(stage_plan, combined),
+            combined.in_size,
+            stage_plan.size if stage_plan.size is not None else combined.size,
+        )
+    return combined
+
+
+# Write the output of a pipeline applied to document `doc' to `outfile',
+# and return the number of pages written and the notes on the output.
+def write_pipeline(
+    doc: PdfDocument | PsReader,
+    outfile: IO[bytes],
+    stages: list[Stage],
+    options: TransformOptions | None,
+    infile_name: str | None,
+    verbose: bool,
+) -> tuple[int, list[str]]:
+    in_size = doc.size
+    in_size_guessed = doc.size_guessed
+    if in_size is None:
+        in_size = get_paper_size()
+        in_size_guessed = True
+    if in_size is None:
+        die("input page size not set, and could not get default paper size")
+    combined = pipeline_plan(stages, doc.get_num_pages(), in_size)
+    transform = document_transform(
+        doc,
+        outfile,
+        combined.size,
+        combined.in_size,
+        [[PageSpec()]],
+        0,
+        in_size_guessed and combined.in_size is in_size,
+        options,
+        infile_name,
+    )
+    transform.write_pages(combined.plan, verbose)
+    return combined.plan.num_pages(), transform.notes()
+
+
+# Run a pipeline on a file, reading the input and writing the output once.
+def run_pipeline(
+    infile_name: str | None,
+    outfile_name: str | None,
+    stages: list[Stage],
+    options: TransformOptions | None = None,
+    verbose: bool = True,
+) -> None:
+    with setup_input_and_output(infile_name, outfile_name) as (
+        infile,
+        file_type,
+        outfile,
+    ):
+        doc = document_reader(infile, file_type, options)
+        write_pipeline(
+            doc,
+            outfile,
+            stages,
+            options,
+            infile_name if infile_name != "-" else None,
+            verbose,
+        )
+
+
+# An output of a fan-out: the name of the file to write (None or `-' for
+# standard output), and the pipeline that makes it.
+class Target(NamedTuple):
+    outfile_name: str | None
+    stages: list[Stage]
+
+
+# Make several outputs from one file, reading and indexing the input once.
+# PostScript outputs are written concurrently, each reading the shared
+# input through its own file position. PDF documents are parsed lazily,
+# so their outputs share the parsed document and are written in turn.
+def run_fanout(
+    infile_name: str | None,
+    targets: list[Target],
+    options: TransformOptions | None = None,
+    verbose: bool = True,
+) -> None:
+    if sum(target.outfile_name in (None, "-") for target in targets) > 1:
+        die("only one output can be written to standard output")
+    infile, file_type = read_input(infile_name)
+    with infile:
+        doc = document_reader(infile, file_type, options)
+        data = infile.getvalue()
+
+        def write_target(target: Target) -> tuple[int, list[str]]:
+            target_doc = (
+                doc.with_file(io.BytesIO(data)) if isinstance(doc, PsReader) else doc
+            )
+            with open_output(target.outfile_name) as outfile:
+                return write_pipeline(
+                    target_doc,
+                    outfile,
+                    target.stages,
+                    options,
+                    infile_name if infile_name != "-" else None,
+                    False,
+                )
+
+        jobs = len(targets) if isinstance(doc, PsReader) else 1
+        with ThreadPoolExecutor(jobs) as executor:
+            written = list(executor.map(write_target, targets))
+    if verbose:
+        for target, (num_pages, notes) in zip(targets, written):
+            outfile_name = target.outfile_name
+            if outfile_name is None or outfile_name == "-":
+                outfile_name = "standard output"
+            print(f"Wrote {num_pages} pages to {outfile_name}", file=sys.stderr)
+            for note in notes:
+                print(note, file=sys.stderr)
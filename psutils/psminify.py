@@ -0,0 +1,140 @@
+"""PSUtils PostScript minification.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import re
+
+
+# White space characters
+whitespace = b" \t\r\n\f\0"
+
+# Characters that delimit tokens, so that no white space is needed before
+# them, and those that no white space is needed after (not `/', as a `/'
+# on its own is an empty name).
+delimiters = b"()<>[]{}/%"
+delimiters_after = b"()<>[]{}"
+
+# Real numbers with trailing zeros after the point, and with a zero before
+# the point that can be left out
+trailing_zeros = re.compile(rb"([+-]?\d+\.\d*?)0+")
+leading_zero = re.compile(rb"([+-]?)0(\.\d+)")
+
+
+# Write a number in its shortest form; the result is still a real.
+def shorten_number(token: bytes) -> bytes:
+    m = trailing_zeros.fullmatch(token)
+    if m:
+        token = m[1]
+    m = leading_zero.fullmatch(token)
+    if m:
+        token = m[1] + m[2]
+    return token
+
+
+# Lines that start data that the program reads itself, which is copied
+# unchanged up to the next %%End comment.
+def starts_data(line: bytes) -> bool:
+    return (
+        line.startswith((b"%%BeginBinary", b"%%BeginData"))
+        or b"currentfile" in line
+        or b"eexec" in line
+    )
+
+
+# Remove comments that are not DSC comments, blank lines, and white space
+# that is not needed to separate tokens, from PostScript code, keeping its
+# lines. Strings, and data that the program reads itself, are kept as
+# they are.
+class PsMinifier:
+    def __init__(self) -> None:
+        # Nesting depth of parentheses in a string that continues over
+        # lines, whether an ASCII85 string continues over lines, and
+        # whether data is being copied
+        self.depth = 0
+        self.ascii85 = False
+        self.data = False
+
+    def minify(self, text: bytes) -> bytes:
+        out = []
+        for line in text.splitlines(keepends=True):
+            out.append(self.minify_line(line))
+        return b"".join(out)
+
+    def minify_line(self, line: bytes) -> bytes:
+        if self.data:
+            if line.startswith(b"%%End"):
+                self.data = False
+            return line
+        in_code = self.depth == 0 and not self.ascii85
+        if in_code and (line.startswith((b"%%", b"%!")) or starts_data(line)):
+            self.data = starts_data(line)
+            return line
+        content = line.rstrip(b"\r\n")
+        result = bytearray()
+        i, space = 0, False
+        while i < len(content):
+            c = content[i : i + 1]
+            if self.ascii85:
+                end = content.find(b"~>", i)
+                if end < 0:
+                    result += content[i:]
+                    break
+                result += content[i : end + 2]
+                i = end + 2
+                self.ascii85 = False
+            elif self.depth > 0:
+                if c == b"\\":
+                    result += content[i : i + 2]
+                    i += 2
+                    continue
+                if c == b"(":
+                    self.depth += 1
+                elif c == b")":
+                    self.depth -= 1
+                result += c
+                i += 1
+            elif c in whitespace:
+                space = True
+                i += 1
+            elif c == b"%":
+                break
+            else:
+                if space and len(result) > 0:
+                    if result[-1:] not in delimiters_after and c not in delimiters:
+                        result += b" "
+                space = False
+                if c == b"(":
+                    self.depth = 1
+                    result += c
+                    i += 1
+                elif content.startswith(b"<~", i):
+                    self.ascii85 = True
+                    result += c
+                    i += 1
+                elif c in b"<>[]{}":
+                    result += c
+                    i += 1
+                else:
+                    # A name or another token
+                    start = i
+                    while i < len(content) and content[i : i + 1] == b"/":
+                        i += 1
+                    while (
+                        i < len(content)
+                        and content[i : i + 1] not in whitespace
+                        and content[i : i + 1] not in delimiters
+                    ):
+                        i += 1
+                    token = content[start:i]
+                    result += token if c == b"/" else shorten_number(token)
+        if self.depth > 0 or self.ascii85:
+            # The newline is part of a string
+            return bytes(result) + line[len(content) :]
+        return bytes(result) + b"\n" if len(result) > 0 else b""
+
+
+# Minify the PostScript code `text'.
+def minify_ps(text: bytes) -> bytes:
+    return PsMinifier().minify(text)
@@ -5,27 +5,319 @@ Released under the GPL version 3, or (at your option) any later version.
 """
 
 import re
-from typing import IO
+from bisect import bisect_right
+from copy import copy
+from typing import IO, Any, NamedTuple, cast
 
+from pypdf import PageObject
 from pypdf import PdfReader as PdfReaderBase
 from pypdf._utils import StrByteType
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    PdfObject,
+    RectangleObject,
+)
 
-from .types import Rectangle
+from .engines import PdfDocument, pdf_engine
+from .types import Box, PageBoxes, PageGeometry, Rectangle, TransformOptions
 from .warnings import die
 
 
+# Page attributes that pages inherit from their ancestors in the page tree
+inheritable_page_attributes = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+# Delimiters and white space in PDF syntax
+pdf_delimiters = rb"\x00\s()<>\[\]{}/%"
+
+# The tokens of PDF syntax that matter when copying an object without
+# parsing it
+pdf_token = re.compile(
+    rb"(?P<ref>(?P<num>\d+)\s+(?P<gen>\d+)\s+R)(?![^" + pdf_delimiters + rb"])"
+    rb"|(?P<open><<|\[)|(?P<close>>>|\])"
+    rb"|(?P<string>\()|(?P<hex><[^>]*>)"
+    rb"|(?P<name>/[^" + pdf_delimiters + rb"]*)"
+    rb"|(?P<comment>%[^\r\n]*)"
+    rb"|(?P<word>[^" + pdf_delimiters + rb"]+)"
+)
+pdf_object_header = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\s*")
+pdf_string_char = re.compile(rb"[()\\]")
+pdf_stream_end = re.compile(rb"\s*endstream")
+
+
+# An object as it appears in a PDF file: its text, split at the indirect
+# references in it, and the data of its stream, if it has one. `type' is
+# its /Type, if it is a dictionary that has one.
+class RawObject(NamedTuple):
+    pieces: list[bytes | IndirectObject]
+    stream: bytes | None
+    type: bytes | None
+
+
+# Return the position after the end of the literal string that starts
+# before position `pos' of `data', or -1 if it does not end.
+def string_end(data: bytes, pos: int) -> int:
+    depth = 1
+    while depth > 0:
+        match = pdf_string_char.search(data, pos)
+        if match is None:
+            return -1
+        pos = match.end()
+        if match[0] == b"\\":
+            pos += 1
+        elif match[0] == b"(":
+            depth += 1
+        else:
+            depth -= 1
+    return pos
+
+
+# Nodes without a /Type are taken to be pages unless they have /Kids.
+def is_page_tree_node(node: DictionaryObject) -> bool:
+    return node.get("/Type", "/Pages" if "/Kids" in node else "/Page") == "/Pages"
+
+
 class PdfReader(PdfReaderBase):
     def __init__(
         self,
         stream: StrByteType,
         strict: bool = False,
         password: str | bytes | None = None,
+        lazy: bool = True,
     ) -> None:
         super().__init__(stream, strict, password)
+        self.lazy = lazy
+        self.lazy_pages: dict[int, PageObject] = {}
+        self.page_tree_ends: dict[int, tuple[DictionaryObject, list[int]]] = {}
+        self.object_ends: list[int] | None = None
+        self.page_tree_nodes: set[int] | None = None
         assert len(self.pages) > 0
-        mediabox = self.pages[0].mediabox
-        self.size = Rectangle(mediabox.width, mediabox.height)
         self.size_guessed = False
+        self.geometry = PageGeometry(self.get_num_pages(), self.read_page_geometry)
+
+    # The size of the document is that of its first page, which is only
+    # read when it is needed.
+    @property
+    def size(self) -> Rectangle:
+        size = self.geometry.media_size(0)
+        assert size is not None
+        return size
+
+    # Read the geometry of a page for the geometry index.
+    def read_page_geometry(self, page_number: int) -> PageBoxes:
+        page = self.pages[page_number]
+
+        # Read the boxes directly, as pypdf's accessors add the boxes they
+        # default to the page.
+        def box(rectangle: Any) -> Box:
+            rectangle = RectangleObject(rectangle)
+            return rectangle.left, rectangle.bottom, rectangle.right, rectangle.top
+
+        media = box(page.mediabox)
+        crop = box(page["/CropBox"]) if "/CropBox" in page else media
+        trim = box(page["/TrimBox"]) if "/TrimBox" in page else crop
+        return PageBoxes(media, crop, trim, None, page.rotation)
+
+    # In lazy mode, the number of pages is read from the root of the page
+    # tree, and each page is found by descending the tree, so that only the
+    # nodes on the path to the pages that are used are read, rather than the
+    # whole tree. If the page tree turns out to be inconsistent, fall back to
+    # reading all of it.
+    def get_num_pages(self) -> int:
+        if self.lazy and self.flattened_pages is None:
+            pages = cast(DictionaryObject, self.root_object["/Pages"].get_object())
+            count = pages.get("/Count")
+            if isinstance(count, int) and count >= 0:
+                return count
+            self.lazy = False
+        return super().get_num_pages()
+
+    def get_page(self, page_number: int) -> PageObject:
+        if self.lazy and self.flattened_pages is None:
+            if page_number not in self.lazy_pages:
+                page = self.find_page(page_number)
+                if page is None:
+                    self.lazy = False
+                    return super().get_page(page_number)
+                self.lazy_pages[page_number] = page
+            return self.lazy_pages[page_number]
+        return super().get_page(page_number)
+
+    # Find the given page using the /Count of each node of the page tree, or
+    # return None if it cannot be found.
+    def find_page(self, page_number: int) -> PageObject | None:
+        node = cast(DictionaryObject, self.root_object["/Pages"].get_object())
+        ref = None
+        inherit: dict[str, PdfObject] = {}
+        visited: set[int] = set()
+        while page_number >= 0 and id(node) not in visited:
+            visited.add(id(node))
+            if not is_page_tree_node(node):
+                if page_number != 0:
+                    break
+                page = PageObject(self, ref)
+                page.update(node)
+                for attr, value in inherit.items():
+                    if attr not in page:
+                        page[NameObject(attr)] = value
+                return page
+            for attr in inheritable_page_attributes:
+                if attr in node:
+                    inherit[attr] = node.raw_get(attr)
+            kids = node.get("/Kids")
+            if not isinstance(kids, ArrayObject):
+                break
+            ends = self.kid_ends(node, kids)
+            if ends is None:
+                return None
+            i = bisect_right(ends, page_number)
+            if i == len(ends):
+                break
+            if i > 0:
+                page_number -= ends[i - 1]
+            node = cast(DictionaryObject, kids[i].get_object())
+            ref = kids[i] if isinstance(kids[i], IndirectObject) else None
+        return None
+
+    # Return the number of pages under each kid of a page tree node and
+    # those before it, or None if a kid has no valid /Count. The result is
+    # cached, so that finding each page of a node with many kids takes
+    # logarithmic time.
+    def kid_ends(self, node: DictionaryObject, kids: ArrayObject) -> list[int] | None:
+        if id(node) not in self.page_tree_ends:
+            ends = []
+            total = 0
+            for kid in kids:
+                obj = kid.get_object()
+                if isinstance(obj, DictionaryObject) and len(obj) > 0:
+                    count = obj.get("/Count") if is_page_tree_node(obj) else 1
+                    if not isinstance(count, int):
+                        return None
+                    total += max(count, 0)
+                ends.append(total)
+            self.page_tree_ends[id(node)] = (node, ends)
+        return self.page_tree_ends[id(node)][1]
+
+    # Return the object numbers of the nodes of the page tree, found by
+    # following /Kids from its root.
+    def page_tree_numbers(self) -> set[int]:
+        if self.page_tree_nodes is None:
+            self.page_tree_nodes = set()
+            refs = [self.root_object.raw_get("/Pages")]
+            while len(refs) > 0:
+                ref = refs.pop()
+                if (
+                    not isinstance(ref, IndirectObject)
+                    or ref.idnum in self.page_tree_nodes
+                ):
+                    continue
+                node = ref.get_object()
+                if isinstance(node, DictionaryObject) and is_page_tree_node(node):
+                    self.page_tree_nodes.add(ref.idnum)
+                    kids = node.get("/Kids")
+                    if isinstance(kids, ArrayObject):
+                        refs.extend(kids)
+        return self.page_tree_nodes
+
+    # Return the object that `ref' refers to as it appears in the file, or
+    # None if it cannot be read without parsing: when it is compressed,
+    # encrypted, or not where the cross-reference table says it is.
+    def raw_object(self, ref: IndirectObject) -> RawObject | None:
+        offset = self.xref.get(ref.generation, {}).get(ref.idnum)
+        if (
+            offset is None
+            or self.is_encrypted
+            or (ref.generation == 0 and ref.idnum in self.xref_objStm)
+            or self.xref_free_entry.get(ref.generation, {}).get(ref.idnum, False)
+        ):
+            return None
+        # Objects do not overlap, so each ends before the next one starts.
+        if self.object_ends is None:
+            self.stream.seek(0, 2)
+            self.object_ends = sorted(
+                {pos for entries in self.xref.values() for pos in entries.values()}
+                | {self.stream.tell()}
+            )
+        i = bisect_right(self.object_ends, offset)
+        if i == len(self.object_ends):
+            return None
+        self.stream.seek(offset)
+        data = self.stream.read(self.object_ends[i] - offset)
+        match = pdf_object_header.match(data)
+        if match is None or (int(match[1]), int(match[2])) != (
+            ref.idnum,
+            ref.generation,
+        ):
+            return None
+        pieces: list[bytes | IndirectObject] = []
+        start = pos = match.end()
+        depth = 0
+        is_dict = None
+        key = type_ = length = None
+        has_kids = False
+        while True:
+            match = pdf_token.search(data, pos)
+            if match is None:
+                return None
+            kind, pos = match.lastgroup, match.end()
+            if kind == "comment":
+                continue
+            if depth == 0 and kind == "word" and match[0] in (b"endobj", b"stream"):
+                break
+            if is_dict is None:
+                is_dict = match[0] == b"<<"
+            # Follow the keys and values of a dictionary object.
+            if is_dict and depth == 1 and kind != "close":
+                if key is None:
+                    key = match[0]
+                else:
+                    if key == b"/Type":
+                        type_ = match[0]
+                    elif key == b"/Length":
+                        length = match
+                    elif key == b"/Kids":
+                        has_kids = True
+                    key = None
+            if kind == "open":
+                depth += 1
+            elif kind == "close":
+                depth -= 1
+            elif kind == "string":
+                pos = string_end(data, pos)
+                if pos < 0:
+                    return None
+            elif kind == "ref":
+                pieces.append(data[start : match.start()])
+                pieces.append(
+                    IndirectObject(int(match["num"]), int(match["gen"]), self)
+                )
+                start = pos
+        pieces.append(data[start : match.start()].rstrip())
+        # Other dictionaries have /Kids, such as form fields, so only those
+        # in the page tree are taken to be nodes of it.
+        if has_kids and type_ is None and ref.idnum in self.page_tree_numbers():
+            type_ = b"/Pages"
+        if match[0] == b"endobj":
+            return RawObject(pieces, None, type_)
+        # The stream keyword is followed by an end of line, then the data.
+        if data.startswith(b"\r\n", pos):
+            pos += 2
+        elif data.startswith((b"\n", b"\r"), pos):
+            pos += 1
+        if length is None:
+            return None
+        if length.lastgroup == "ref":
+            size = self.get_object(
+                IndirectObject(int(length["num"]), int(length["gen"]), self)
+            )
+        else:
+            size = int(length[0]) if length[0].isdigit() else None
+        if not isinstance(size, int) or pdf_stream_end.match(data, pos + size) is None:
+            return None
+        return RawObject(pieces, data[pos : pos + size], type_)
 
 
 size_keywords = (
@@ -54,11 +346,37 @@ class PsReader:
         self.infile.seek(0)
         record, next_record, buffer = 0, 0, None
         file_sizes = {}
+        # The sizes of the media named by %%DocumentMedia, the media named
+        # by %%PageMedia before the first page and for each page, and the
+        # bounding box of each page
+        media_sizes: dict[bytes, Rectangle] = {}
+        default_media = None
+        page_media: dict[int, bytes] = {}
+        page_bboxes: dict[int, Box] = {}
+        keyword = None
         for buffer in self.infile:
             next_record += len(buffer)
-            if buffer.startswith(b"%%"):
+            if buffer.startswith(b"%%+") and keyword == b"DocumentMedia":
+                self.read_media(buffer[3:], media_sizes)
+            elif buffer.startswith(b"%%"):
                 keyword, value = self.comment(buffer)
                 if keyword is not None:
+                    assert value is not None
+                    if nesting == 0 and keyword == b"DocumentMedia":
+                        self.read_media(value, media_sizes)
+                    elif nesting == 0 and keyword == b"PageMedia":
+                        if len(self.pageptr) == 0:
+                            default_media = value.strip()
+                        else:
+                            page_media[len(self.pageptr) - 1] = value.strip()
+                    elif (
+                        nesting == 0
+                        and keyword == b"PageBoundingBox"
+                        and len(self.pageptr) > 0
+                    ):
+                        bbox = self.read_box(value)
+                        if bbox is not None:
+                            page_bboxes[len(self.pageptr) - 1] = bbox
                     # If input paper size is not set, try to read it
                     if (
                         self.headerpos == 0
@@ -137,21 +455,83 @@ class PsReader:
                     break
         self.num_pages = len(self.pageptr)
         self.pageptr.append(record)
+
+        # Index the geometry of the pages
+        self.geometry = PageGeometry(self.num_pages)
+        for n in range(self.num_pages):
+            media_name = page_media.get(n, default_media)
+            media = media_sizes.get(media_name) if media_name is not None else None
+            bbox = page_bboxes.get(n)
+            if media is not None or bbox is not None:
+                self.geometry.set_page(
+                    n,
+                    PageBoxes(
+                        (0.0, 0.0, media.width, media.height)
+                        if media is not None
+                        else None,
+                        bbox=bbox,
+                    ),
+                )
         if self.endsetup == 0 or self.endsetup > self.pageptr[0]:
             self.endsetup = self.pageptr[0]
 
+    def get_num_pages(self) -> int:
+        return self.num_pages
+
+    # Record the size of the medium described by the value of a
+    # %%DocumentMedia comment.
+    def read_media(self, value: bytes, media_sizes: dict[bytes, Rectangle]) -> None:
+        words = value.split()
+        if len(words) > 2:
+            try:
+                media_sizes[words[0]] = Rectangle(float(words[1]), float(words[2]))
+            except ValueError:
+                pass
+
+    # Return the box given by the value of a bounding box comment, or None
+    # if it is not valid.
+    def read_box(self, value: bytes) -> Box | None:
+        words = value.split()
+        if len(words) != 4:
+            return None
+        try:
+            left, bottom, right, top = (float(word) for word in words)
+        except ValueError:
+            return None
+        return left, bottom, right, top
+
+    # The input file is not pickled, so that a reader can be sent to a
+    # worker process, which must open the file itself.
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["infile"]
+        return state
+
+    # Return a reader of the same document that reads it from `infile', so
+    # that several parts of the document can be read at once without
+    # reading the document again.
+    def with_file(self, infile: IO[bytes]) -> "PsReader":
+        reader = copy(self)
+        reader.infile = infile
+        return reader
+
     # Return comment keyword and value if `line' is a DSC comment
     def comment(self, line: bytes) -> tuple[bytes, bytes] | tuple[None, None]:
         m = re.match(b"%%([^:]+):?\\s+?(.*\\S?)\\s*$", line)
         return (m[1], m[2]) if m else (None, None)
 
 
-def document_reader(file: IO[bytes], file_type: str) -> PdfReader | PsReader:
-    constructor: type[PdfReader] | type[PsReader]
+# PDF documents are read with the engine that will be used to transform
+# them with the given options and border width.
+def document_reader(
+    file: IO[bytes],
+    file_type: str,
+    options: TransformOptions | None = None,
+    draw: float = 0,
+) -> PdfDocument | PsReader:
     if file_type in (".ps", ".eps"):
-        constructor = PsReader
-    elif file_type == ".pdf":
-        constructor = PdfReader
-    else:
-        die(f"incompatible file type `{file_type}'")
-    return constructor(file)
+        return PsReader(file)
+    if file_type == ".pdf":
+        options = options if options is not None else TransformOptions()
+        return pdf_engine(options.pdf_engine, options, draw).reader(file)
+    die(f"incompatible file type `{file_type}'")
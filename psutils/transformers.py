@@ -4,58 +4,279 @@ Copyright (c) Reuben Thomas 2023-2025.
 Released under the GPL version 3, or (at your option) any later version.
 """
 
+import base64
+import hashlib
 import io
+import mmap
+import os
 import shutil
 import sys
+import zlib
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections import Counter
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import IO
+from dataclasses import replace
+from typing import IO, Any, cast
 from warnings import warn
 
-from pypdf import PdfWriter, Transformation
+from pypdf import PageObject, PdfWriter, Transformation
 from pypdf.annotations import PolyLine
+from pypdf.generic import (
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    RectangleObject,
+    StreamObject,
+)
 
 from .argparse import parserange
-from .io import setup_input_and_output
+from .engines import PdfDocument, PdfEngine, document_engine, register_pdf_engine
+from .io import open_output, read_input
+from .pdfresources import (
+    content_key,
+    downsample_images,
+    form_page,
+    prune_resources,
+    resample_image,
+)
+from .psminify import minify_ps
 from .readers import PdfReader, PsReader, document_reader
-from .types import Offset, PageList, PageSpec, Range, Rectangle
+from .types import (
+    ImpositionPlan,
+    Offset,
+    PageList,
+    PageSpec,
+    Placement,
+    Range,
+    Rectangle,
+    SpecSection,
+    TransformOptions,
+)
 from .warnings import die
+from .writers import PdfPageStreamer, PdfUpdateWriter, write_pdf_document
 
 
-def page_index_to_page_number(
-    spec: PageSpec, maxpage: int, modulo: int, pagebase: int
-) -> int:
-    return (maxpage - pagebase - modulo if spec.reversed else pagebase) + spec.pageno
+# Calculate the transformation that places an input page of size `in_size'
+# on an output page according to `spec'.
+def spec_transformation(spec: PageSpec, in_size: Rectangle) -> Transformation:
+    t = Transformation()
+    if spec.hflip:
+        t = t.transform(Transformation((-1, 0, 0, 1, in_size.width, 0)))
+    elif spec.vflip:
+        t = t.transform(Transformation((1, 0, 0, -1, 0, in_size.height)))
+    if spec.rotate != 0:
+        t = t.rotate(spec.rotate % 360)
+    if spec.scale != 1.0:
+        t = t.scale(spec.scale, spec.scale)
+    if spec.off != Offset(0.0, 0.0):
+        t = t.translate(spec.off.x, spec.off.y)
+    return t
+
+
+# Plan the placement of the given pages of a document of `total_pages'
+# pages according to `specs'.
+def page_plan(
+    total_pages: int,
+    specs: list[list[PageSpec]],
+    pagerange: list[Range] | PageList | None,
+    reverse: bool,
+    odd: bool,
+    even: bool,
+    modulo: int,
+) -> ImpositionPlan:
+    # A page list is used as given.
+    if isinstance(pagerange, PageList):
+        return ImpositionPlan(pagerange, total_pages, specs, modulo)
+
+    # Page spec routines for page rearrangement
+    def abs_page(n: int) -> int:
+        if n < 0:
+            n += total_pages + 1
+            n = max(n, 1)
+        return n
+
+    # If no page range given, select all pages
+    if pagerange is None:
+        pagerange = parserange("1-_1")
+
+    # Normalize end-relative pageranges
+    pagerange = [
+        Range(abs_page(range_.start), abs_page(range_.end), range_.text)
+        for range_ in pagerange
+    ]
+
+    # Get list of pages
+    page_list = PageList(total_pages, pagerange, reverse, odd, even)
+    return ImpositionPlan(page_list, total_pages, specs, modulo)
+
+
+# Plan the placement of the pages of each section of a document in turn.
+def sections_plan(
+    total_pages: int,
+    sections: list[SpecSection],
+    reverse: bool,
+    odd: bool,
+    even: bool,
+) -> ImpositionPlan:
+    return ImpositionPlan.concatenate(
+        [
+            page_plan(
+                total_pages,
+                section.specs,
+                section.pagerange,
+                reverse,
+                odd,
+                even,
+                section.modulo,
+            )
+            for section in sections
+        ]
+    )
+
+
+# Work out the output pages of a document of `num_pages' pages to write to
+# each file of a split: either `split' pages to each file, or the pages of
+# each of the ranges `split'.
+def split_chunks(split: int | list[Range], num_pages: int) -> list[range]:
+    if isinstance(split, int):
+        return [
+            range(first, min(first + split, num_pages + 1))
+            for first in range(1, num_pages + 1, split)
+        ]
+    chunks = []
+    for range_ in split:
+        start, end = range_.start, range_.end
+        if start < 0:
+            start = max(start + num_pages + 1, 1)
+        if end < 0:
+            end = max(end + num_pages + 1, 1)
+        if not (0 < start <= num_pages and 0 < end <= num_pages):
+            die(f"page range {range_.text} is invalid", 2)
+        inc = -1 if end < start else 1
+        chunks.append(range(start, end + inc, inc))
+    return chunks
+
+
+# Return the names of the `n' files of a split of output to `outfile_name',
+# numbered from 1 before the file's extension.
+def split_file_names(outfile_name: str | None, n: int) -> list[str]:
+    if outfile_name is None or outfile_name == "-":
+        die("an output file name must be given to split the output")
+    root, ext = os.path.splitext(outfile_name)
+    width = len(str(n))
+    return [f"{root}-{i:0{width}d}{ext}" for i in range(1, n + 1)]
 
 
 class DocumentTransform(ABC):
-    def __init__(self) -> None:
+    def __init__(
+        self, options: TransformOptions | None = None, infile_name: str | None = None
+    ) -> None:
         self.in_size: Rectangle | None
         self.specs: list[list[PageSpec]]
+        self.options = options if options is not None else TransformOptions()
+        self.infile_name = infile_name
+        # With several jobs, output pages can be written by worker
+        # processes, in chunks of consecutive output pages; `composed' maps
+        # each such output page to its chunk and its index in the chunk.
+        self.pool: ProcessPoolExecutor | None = None
+        self.composed: dict[int, tuple[Future[Any], int]] = {}
+        # If set, how to split the output (see split_chunks), and the name
+        # of the output file after which the files of the split are named.
+        self.split: tuple[int | list[Range], str | None] | None = None
 
     @abstractmethod
     def pages(self) -> int:
         pass
 
+    # The size of input page `n', if pages have their own sizes.
+    def page_size(self, n: int) -> Rectangle | None:
+        return None
+
     @abstractmethod
-    def write_header(self, maxpage: int, modulo: int) -> None:
+    def write_header(self, plan: ImpositionPlan) -> None:
         pass
 
+    # Whether the transforms returned by chunk_transform can be used at the
+    # same time.
+    concurrent_chunks = False
+
+    # Return a transform like this one that writes to `outfile', to write a
+    # chunk of the output of a split.
     @abstractmethod
-    def write_page_comment(self, pagelabel: str, outputpage: int) -> None:
+    def chunk_transform(self, outfile: IO[bytes]) -> "DocumentTransform":
+        pass
+
+    # Called with the plan of the whole output before it is split, so that
+    # the work shared by all the files of the split can be done once.
+    def prepare_header(self, plan: ImpositionPlan) -> None:
         pass
 
     @abstractmethod
-    def write_page(
+    def write_page_comment(self, pagelabel: str, outputpage: int) -> None:
+        pass
+
+    # Notes on the output written, to report when verbose.
+    def notes(self) -> list[str]:
+        return []
+
+    # Called with the plan before the output pages are written, so that
+    # work on them can be started in advance.
+    def start_pages(self, plan: ImpositionPlan) -> None:
+        pass
+
+    # Whether output pages can be written by worker processes, which read
+    # the input file themselves.
+    def use_workers(self) -> bool:
+        if self.options.jobs == 1:
+            return False
+        if self.infile_name is None:
+            warn("cannot use worker processes when reading standard input")
+            return False
+        return True
+
+    # Split the given output pages into one chunk per job, and call
+    # `function' on each chunk in a worker process, with the given
+    # arguments followed by the chunk.
+    # Fewer, larger chunks keep down the work repeated for each chunk.
+    def submit_pages(
         self,
-        page_list: PageList,
-        outputpage: int,
-        page_specs: list[PageSpec],
-        maxpage: int,
-        modulo: int,
-        pagebase: int,
+        pages: list[int],
+        function: Callable[..., Any],
+        *args: Any,
     ) -> None:
+        jobs = min(self.options.jobs, len(pages))
+        self.pool = ProcessPoolExecutor(jobs)
+        for i in range(jobs):
+            chunk = pages[i * len(pages) // jobs : (i + 1) * len(pages) // jobs]
+            future = self.pool.submit(function, *args, chunk)
+            for index, outputpage in enumerate(chunk):
+                self.composed[outputpage] = (future, index)
+
+    # Number the distinct contents of the input pages placed by `plan'
+    # that are used more than once, and return the number of each page
+    # with such content. `content_key' returns a hash of the content of an
+    # input page, or None if it cannot be shared.
+    def find_shared_pages(
+        self, plan: ImpositionPlan, content_key: Callable[[int], bytes | None]
+    ) -> dict[int, int]:
+        uses = Counter(page for page in plan.source_page if page >= 0)
+        pages_by_key: dict[bytes, list[int]] = {}
+        for page in uses:
+            key = content_key(page)
+            if key is not None:
+                pages_by_key.setdefault(key, []).append(page)
+        groups = [
+            pages
+            for pages in pages_by_key.values()
+            if sum(uses[page] for page in pages) > 1
+        ]
+        return {page: index for index, pages in enumerate(groups) for page in pages}
+
+    @abstractmethod
+    def write_page(self, plan: ImpositionPlan, outputpage: int) -> None:
         pass
 
     @abstractmethod
@@ -64,7 +285,7 @@ class DocumentTransform(ABC):
 
     def transform_pages(
         self,
-        pagerange: list[Range] | None,
+        pagerange: list[Range] | PageList | None,
         flipping: bool,
         reverse: bool,
         odd: bool,
@@ -74,65 +295,83 @@ class DocumentTransform(ABC):
     ) -> None:
         if self.in_size is None and flipping:
             die("input page size must be set when flipping the page")
+        plan = self.plan_pages(pagerange, reverse, odd, even, modulo)
+        self.write_pages(plan, verbose)
 
-        # Page spec routines for page rearrangement
-        def abs_page(n: int) -> int:
-            if n < 0:
-                n += self.pages() + 1
-                n = max(n, 1)
-            return n
-
-        def transform_pages(
-            pagerange: list[Range] | None, odd: bool, even: bool, reverse: bool
-        ) -> None:
-            outputpage = 0
-            # If no page range given, select all pages
-            if pagerange is None:
-                pagerange = parserange("1-_1")
-
-            # Normalize end-relative pageranges
-            for range_ in pagerange:
-                range_.start = abs_page(range_.start)
-                range_.end = abs_page(range_.end)
-
-            # Get list of pages
-            page_list = PageList(self.pages(), pagerange, reverse, odd, even)
-
-            # Calculate highest page number output (including any blanks)
-            maxpage = (
-                page_list.num_pages()
-                + (modulo - page_list.num_pages() % modulo) % modulo
-            )
-
-            # Rearrange pages
-            self.write_header(maxpage, modulo)
-            pagebase = 0
-            while pagebase < maxpage:
-                for page in self.specs:
-                    # Construct the page label from the input page numbers
-                    pagelabels = []
-                    for spec in page:
-                        n = page_list.real_page(
-                            page_index_to_page_number(spec, maxpage, modulo, pagebase)
-                        )
-                        pagelabels.append(str(n + 1) if n >= 0 else "*")
-                    pagelabel = ",".join(pagelabels)
-                    outputpage += 1
-                    self.write_page_comment(pagelabel, outputpage)
-                    if verbose:
-                        sys.stderr.write(f"[{pagelabel}] ")
-                    self.write_page(
-                        page_list, outputpage, page, maxpage, modulo, pagebase
-                    )
+    # Rearrange each section of the document with its own page specs, in
+    # turn.
+    def transform_sections(
+        self,
+        sections: list[SpecSection],
+        flipping: bool,
+        reverse: bool,
+        odd: bool,
+        even: bool,
+        verbose: bool,
+    ) -> None:
+        if self.in_size is None and flipping:
+            die("input page size must be set when flipping the page")
+        plan = sections_plan(self.pages(), sections, reverse, odd, even)
+        self.write_pages(plan, verbose)
 
-                pagebase += modulo
+    # Work out which input pages go on each output page.
+    def plan_pages(
+        self,
+        pagerange: list[Range] | PageList | None,
+        reverse: bool,
+        odd: bool,
+        even: bool,
+        modulo: int,
+    ) -> ImpositionPlan:
+        return page_plan(
+            self.pages(), self.specs, pagerange, reverse, odd, even, modulo
+        )
 
-            self.finalize()
+    # Write the output document according to `plan'.
+    def write_pages(self, plan: ImpositionPlan, verbose: bool) -> None:
+        if self.split is not None:
+            self.write_split(plan, verbose)
+            return
+        self.write_header(plan)
+        self.start_pages(plan)
+        for outputpage in range(1, plan.num_pages() + 1):
+            pagelabel = plan.label(outputpage)
+            self.write_page_comment(pagelabel, outputpage)
             if verbose:
-                print(f"\nWrote {outputpage} pages", file=sys.stderr)
+                sys.stderr.write(f"[{pagelabel}] ")
+            self.write_page(plan, outputpage)
+
+        self.finalize()
+        if verbose:
+            print(f"\nWrote {plan.num_pages()} pages", file=sys.stderr)
+            for note in self.notes():
+                print(note, file=sys.stderr)
+
+    # Write the output document according to `plan' as several files, as
+    # given by `self.split'.
+    def write_split(self, plan: ImpositionPlan, verbose: bool) -> None:
+        assert self.split is not None
+        split, outfile_name = self.split
+        chunks = split_chunks(split, plan.num_pages())
+        outfile_names = split_file_names(outfile_name, len(chunks))
+        self.prepare_header(plan)
+
+        def write_chunk(chunk: range, chunk_file_name: str) -> DocumentTransform:
+            with open_output(chunk_file_name) as outfile:
+                transform = self.chunk_transform(outfile)
+                transform.write_pages(plan.extract(chunk), False)
+            return transform
 
-        # Output the pages
-        transform_pages(pagerange, odd, even, reverse)
+        jobs = len(chunks) if self.concurrent_chunks else 1
+        with ThreadPoolExecutor(max(jobs, 1)) as executor:
+            transforms = list(executor.map(write_chunk, chunks, outfile_names))
+        if verbose:
+            for chunk, chunk_file_name, transform in zip(
+                chunks, outfile_names, transforms
+            ):
+                print(f"Wrote {len(chunk)} pages to {chunk_file_name}", file=sys.stderr)
+                for note in transform.notes():
+                    print(note, file=sys.stderr)
 
 
 # FIXME: Extract PsWriter.
@@ -182,17 +421,27 @@ end"""
         specs: list[list[PageSpec]],
         draw: float,
         in_size_guessed: bool,
+        options: TransformOptions | None = None,
+        infile_name: str | None = None,
     ):
-        super().__init__()
+        super().__init__(options, infile_name)
         self.reader = reader
         self.outfile = outfile
         self.draw = draw
         self.specs = specs
         self.in_size_guessed = in_size_guessed
 
-        self.use_procset = any(
-            len(page) > 1 or page[0].has_transform() for page in specs
-        )
+        # Set from the plan when the header is written
+        self.use_procset = False
+        # The text of the header before and after the %%Pages comment
+        self.header: tuple[bytes, bytes] | None = None
+        # With --dedupe-pages, the number of the form holding the body of
+        # each input page whose body is used more than once
+        self.shared: dict[int, int] = {}
+        # With --minify, the number of bytes saved in the output, and in
+        # the header
+        self.saved = 0
+        self.header_saved = 0
 
         self.size = size
         if in_size is None:
@@ -205,7 +454,59 @@ end"""
     def pages(self) -> int:
         return self.reader.num_pages
 
-    def write_header(self, maxpage: int, modulo: int) -> None:
+    def page_size(self, n: int) -> Rectangle | None:
+        return self.reader.geometry.media_size(n)
+
+    # PostScript chunks read the input through their own file position.
+    concurrent_chunks = True
+
+    def chunk_transform(self, outfile: IO[bytes]) -> "PsTransform":
+        infile = self.reader.infile
+        if isinstance(infile, io.BytesIO):
+            data = infile.getvalue()
+        else:
+            infile.seek(0)
+            data = infile.read()
+        transform = PsTransform(
+            self.reader.with_file(io.BytesIO(data)),
+            outfile,
+            self.size,
+            self.in_size,
+            self.specs,
+            self.draw,
+            self.in_size_guessed,
+            self.options,
+            self.infile_name,
+        )
+        transform.use_procset = self.use_procset
+        transform.header = self.header
+        transform.header_saved = self.header_saved
+        transform.shared = self.shared
+        return transform
+
+    def prepare_header(self, plan: ImpositionPlan) -> None:
+        if self.header is None:
+            self.use_procset = plan.transforms_pages()
+            if self.options.dedupe_pages:
+                self.shared = self.find_shared_pages(plan, self.page_body_key)
+            self.header = self.read_header()
+
+    def write_header(self, plan: ImpositionPlan) -> None:
+        self.prepare_header(plan)
+        assert self.header is not None
+        before, after = self.header
+        self.saved += self.header_saved
+        self.outfile.write(before)
+        if self.reader.pagescmt:
+            self.write(f"%%Pages: {plan.num_pages()} 0")
+        self.outfile.write(after)
+
+    # Read the header and prologue of the document, as they are to be
+    # written, returning the text before and after the %%Pages comment.
+    def read_header(self) -> tuple[bytes, bytes]:
+        saved = self.saved
+        outfile = self.outfile
+        self.outfile = before = io.BytesIO()
         # FIXME: doesn't cope properly with loaded definitions
         ignorelist = [] if self.size is None else self.reader.sizeheaders
         self.reader.infile.seek(0)
@@ -224,14 +525,17 @@ end"""
                 self.write(
                     f"%%BoundingBox: 0 0 {int(self.size.width)} {int(self.size.height)}"
                 )
-            pagesperspec = len(self.specs)
-            self.write(f"%%Pages: {int(maxpage / modulo) * pagesperspec} 0")
         elif self.size is not None:
             warn("could not find document header, so cannot set output paper size")
+        self.outfile = after = io.BytesIO()
         self.fcopy(self.reader.headerpos, ignorelist)
         if self.use_procset:
             self.write(f"%%BeginProcSet: PStoPS 1 15\n{self.procset}")
             self.write("%%EndProcSet")
+        if self.options.compress_pages:
+            self.write("%%BeginResource: procset PStoPSinflate")
+            self.write(self.inflate_procset)
+            self.write("%%EndResource")
 
         # Write prologue to end of setup section, skipping our procset if present
         # and we're outputting it (this allows us to upgrade our procset)
@@ -248,29 +552,165 @@ end"""
  matrix invertmatrix put"""
             )
 
+        # Define the forms of shared pages in the setup, after the prologue
+        # that they may use.
+        self.write_forms()
+
         # Write from end of setup to start of pages
         self.fcopy(self.reader.pageptr[0], [])
+        self.outfile = outfile
+        texts = before.getvalue(), after.getvalue()
+        if self.options.minify:
+            texts = self.minify(texts[0]), self.minify(texts[1])
+        self.header_saved, self.saved = self.saved - saved, saved
+        return texts
+
+    # The range of the input file holding the body of input page `n', as
+    # copied by write_page.
+    def page_body(self, n: int) -> range:
+        self.reader.infile.seek(self.reader.pageptr[n])
+        try:
+            self.reader.infile.readline()
+            if self.reader.procset_pos:
+                # Skip the page setup
+                while True:
+                    line = self.reader.infile.readline()
+                    if line == b"" or line.startswith(b"PStoPSxform"):
+                        break
+        except OSError:
+            die(f"I/O error reading page {n + 1}", 2)
+        return range(self.reader.infile.tell(), self.reader.pageptr[n + 1])
+
+    # Return a hash of the body of input page `n', or None if the body
+    # cannot be held in a form.
+    def page_body_key(self, n: int) -> bytes | None:
+        body = self.page_body(n)
+        data = self.reader.infile.read(len(body))
+        if self.form_end in data:
+            return None
+        return hashlib.sha256(data).digest()
+
+    # Execute the compressed code that follows in the current file, then
+    # read the rest of the data, up to the end of the ASCII85 encoding.
+    inflate_procset = """userdict/PStoPSinflate{currentfile/ASCII85Decode filter
+ dup/FlateDecode filter cvx exec flushfile}bind put"""
+
+    # Copy the input from the current position to `upto', compressing the
+    # code between the DSC comments at its start and its page trailer, to
+    # be decompressed and executed by PStoPSinflate. The page setup is
+    # compressed with the rest of the code, as a `restore' in the page of
+    # a `save' made before the decoding filters were made would close
+    # them.
+    def write_compressed(self, upto: int) -> None:
+        try:
+            body = self.reader.infile.read(upto - self.reader.infile.tell())
+        except OSError:
+            die("I/O error", 2)
+        start = 0
+        while (
+            body.startswith(b"%%", start)
+            and not body.startswith(b"%%Begin", start)
+            and body.find(b"\n", start) >= 0
+        ):
+            start = body.find(b"\n", start) + 1
+        end = body.rfind(b"\n%%PageTrailer") + 1
+        if end <= start:
+            end = len(body)
+        self.outfile.write(body[:start])
+        code = body[start:end]
+        if code.strip() != b"":
+            self.write("PStoPSinflate")
+            level = -1
+            if self.options.compress_level is not None:
+                level = self.options.compress_level
+            data = base64.a85encode(zlib.compress(code, level), wrapcol=75)
+            for line in data.splitlines():
+                # Keep lines that start with `%' from looking like comments
+                if line.startswith(b"%"):
+                    self.outfile.write(b" ")
+                self.outfile.write(line + b"\n")
+            self.outfile.write(b"~>\n")
+        self.outfile.write(body[end:])
+
+    # The end of the data of a form
+    form_end = b"%%EndPStoPSform"
+
+    # Define the forms of the shared page bodies, each as a reusable stream
+    # that the pages that use it execute.
+    def write_forms(self) -> None:
+        here = self.reader.infile.tell()
+        first_pages = {}
+        for page, index in self.shared.items():
+            first_pages.setdefault(index, page)
+        for index, page in first_pages.items():
+            body = self.page_body(page)
+            self.write(f"%%BeginResource: form PStoPSform{index}")
+            self.write(
+                f"userdict/PStoPSform{index} currentfile"
+                f" 0({self.form_end.decode()})/SubFileDecode filter"
+                "/ReusableStreamDecode filter"
+            )
+            self.write(f"%%BeginBinary: {len(body)}")
+            self.fcopy(body.stop, [])
+            self.write("%%EndBinary")
+            self.write(self.form_end.decode())
+            self.write("put")
+            self.write("%%EndResource")
+        self.reader.infile.seek(here)
 
     def write(self, text: str) -> None:
-        self.outfile.write((text + "\n").encode("utf-8"))
+        data = (text + "\n").encode("utf-8")
+        if self.options.minify:
+            data = self.minify(data)
+        self.outfile.write(data)
+
+    # Minify PostScript code, counting the bytes saved.
+    def minify(self, data: bytes) -> bytes:
+        minified = minify_ps(data)
+        self.saved += len(data) - len(minified)
+        return minified
+
+    def notes(self) -> list[str]:
+        if not self.options.minify:
+            return []
+        return [f"Saved {self.saved} bytes by minifying"]
 
     def write_page_comment(self, pagelabel: str, outputpage: int) -> None:
         self.write(f"%%Page: ({pagelabel}) {outputpage}")
 
-    def write_page(
-        self,
-        page_list: PageList,
-        outputpage: int,
-        page_specs: list[PageSpec],
-        maxpage: int,
-        modulo: int,
-        pagebase: int,
-    ) -> None:
-        spec_page_number = 0
-        for spec in page_specs:
-            page_number = page_index_to_page_number(spec, maxpage, modulo, pagebase)
-            real_page = page_list.real_page(page_number)
-            if page_number < page_list.num_pages() and 0 <= real_page < self.pages():
+    def start_pages(self, plan: ImpositionPlan) -> None:
+        if not self.use_workers() or plan.num_pages() < 2:
+            return
+        self.submit_pages(
+            list(range(1, plan.num_pages() + 1)),
+            write_ps_pages,
+            self.infile_name,
+            self.reader,
+            self.size,
+            self.in_size,
+            self.specs,
+            self.draw,
+            self.in_size_guessed,
+            self.use_procset,
+            self.shared,
+            self.options,
+            plan,
+        )
+
+    def write_page(self, plan: ImpositionPlan, outputpage: int) -> None:
+        if outputpage in self.composed:
+            future, index = self.composed.pop(outputpage)
+            text, saved = future.result()[index]
+            self.outfile.write(text)
+            self.saved += saved
+            return
+        placements = plan.placements(outputpage)
+        for spec_page_number, (spec, real_page) in enumerate(placements):
+            # The size of the page, which may differ from the document's
+            in_size = self.in_size
+            if real_page >= 0:
+                in_size = self.page_size(real_page) or in_size
+            if real_page >= 0:
                 # Seek the page
                 pagenum = real_page
                 self.reader.infile.seek(self.reader.pageptr[pagenum])
@@ -289,20 +729,16 @@ end"""
                 if spec.rotate != 0:
                     self.write(f"{spec.rotate % 360} rotate")
                 if spec.hflip == 1:
-                    assert self.in_size is not None
-                    self.write(
-                        f"[ -1 0 0 1 {self.in_size.width * spec.scale:g} 0 ] concat"
-                    )
+                    assert in_size is not None
+                    self.write(f"[ -1 0 0 1 {in_size.width * spec.scale:g} 0 ] concat")
                 if spec.vflip == 1:
-                    assert self.in_size is not None
-                    self.write(
-                        f"[ 1 0 0 -1 0 {self.in_size.height * spec.scale:g} ] concat"
-                    )
+                    assert in_size is not None
+                    self.write(f"[ 1 0 0 -1 0 {in_size.height * spec.scale:g} ] concat")
                 if spec.scale != 1.0:
                     self.write(f"{spec.scale:f} dup scale")
                 self.write("userdict/PStoPSmatrix matrix currentmatrix put")
-                if self.in_size is not None:
-                    w, h = self.in_size.width, self.in_size.height
+                if in_size is not None:
+                    w, h = in_size.width, in_size.height
                     self.write(
                         f"""userdict/PStoPSclip{{0 0 moveto
  {w:f} 0 rlineto 0 {h:f} rlineto {-w:f} 0 rlineto
@@ -312,13 +748,9 @@ end"""
                         self.write(
                             f"gsave clippath 0 setgray {self.draw} setlinewidth stroke grestore"
                         )
-            if spec_page_number < len(page_specs) - 1:
+            if spec_page_number < len(placements) - 1:
                 self.write("/PStoPSenablepage false def")
-            if (
-                self.reader.procset_pos
-                and page_number < page_list.num_pages()
-                and real_page < self.pages()
-            ):
+            if self.reader.procset_pos and real_page >= 0:
                 # Search for page setup
                 while True:
                     try:
@@ -333,16 +765,24 @@ end"""
                         die(f"I/O error writing page setup {outputpage}", 2)
             if not self.reader.procset_pos and self.use_procset:
                 self.write("PStoPSxform concat")
-            if page_number < page_list.num_pages() and 0 <= real_page < self.pages():
+            if real_page in self.shared:
+                self.write(
+                    f"userdict/PStoPSform{self.shared[real_page]} get"
+                    " dup 0 setfileposition cvx exec"
+                )
+            elif real_page >= 0 and self.options.compress_pages:
+                self.write_compressed(self.reader.pageptr[real_page + 1])
+            elif real_page >= 0:
                 # Write the body of a page
                 self.fcopy(self.reader.pageptr[real_page + 1], [])
             else:
                 self.write("showpage")
             if self.use_procset:
                 self.write("PStoPSsaved restore")
-            spec_page_number += 1
 
     def finalize(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
         # Write trailer
         self.reader.infile.seek(self.reader.pageptr[self.pages()])
         shutil.copyfileobj(self.reader.infile, self.outfile)
@@ -371,6 +811,49 @@ end"""
             die("I/O error", 2)
 
 
+# Write the given output pages of a PsTransform in a worker process,
+# reading the input document through a read-only memory map, and return
+# the text of each page.
+def write_ps_pages(
+    infile_name: str,
+    reader: PsReader,
+    size: Rectangle | None,
+    in_size: Rectangle | None,
+    specs: list[list[PageSpec]],
+    draw: float,
+    in_size_guessed: bool,
+    use_procset: bool,
+    shared: dict[int, int],
+    options: TransformOptions,
+    plan: ImpositionPlan,
+    pages: list[int],
+) -> list[tuple[bytes, int]]:
+    texts = []
+    with (
+        open(infile_name, "rb") as infile,
+        mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data,
+    ):
+        reader.infile = cast(IO[bytes], data)
+        transform = PsTransform(
+            reader,
+            io.BytesIO(),
+            size,
+            in_size,
+            specs,
+            draw,
+            in_size_guessed,
+            options,
+        )
+        transform.use_procset = use_procset
+        transform.shared = shared
+        for outputpage in pages:
+            transform.outfile = io.BytesIO()
+            transform.saved = 0
+            transform.write_page(plan, outputpage)
+            texts.append((transform.outfile.getvalue(), transform.saved))
+    return texts
+
+
 class PdfTransform(DocumentTransform):
     def __init__(
         self,
@@ -380,13 +863,62 @@ class PdfTransform(DocumentTransform):
         in_size: Rectangle | None,
         specs: list[list[PageSpec]],
         draw: float,
+        options: TransformOptions | None = None,
+        infile_name: str | None = None,
     ):
-        super().__init__()
+        super().__init__(options, infile_name)
         self.outfile = outfile
         self.reader = reader
         self.writer = PdfWriter()
         self.draw = draw
         self.specs = specs
+        self.prepared_pages: dict[tuple[int, float], PageObject] = {}
+        self.resampled_images: dict[tuple[int, int, int], IndirectObject] = {}
+        # With --dedupe-pages, the number of the shared content of each
+        # input page that has some, worked out from the plan, and the pages
+        # that draw each shared content as a Form XObject, and the content
+        # streams of the pages copied with each.
+        self.shared: dict[int, int] | None = None
+        self.forms: dict[tuple[int, float], PageObject] = {}
+        self.shared_contents: dict[int, Any] = {}
+        self.streamer = None
+        # Pages whose content is not changed are copied byte for byte,
+        # unless the options require their resources or content to be
+        # rewritten.
+        self.copy_pages = not (
+            self.options.remove_duplicates
+            or self.options.dedupe_pages
+            or self.options.prune_resources
+            or self.options.image_dpi is not None
+            or self.options.compress_level is not None
+            or reader.is_encrypted
+        )
+        # The chunk of pages composed by a worker that is being copied
+        self.chunk: tuple[Future[Any], PdfReader] | None = None
+        # The output pages found by `start_pages' (see `output_page'), by
+        # output page number
+        self.output_pages: dict[int, PageObject | None] = {}
+        self.updater = None
+        if self.options.incremental:
+            if reader.is_encrypted:
+                die("--incremental cannot be used with encrypted documents")
+            if not self.copy_pages:
+                die("--incremental cannot be used with options that change pages")
+            self.updater = PdfUpdateWriter(
+                reader,
+                outfile,
+                cast(IndirectObject, self.writer.root_object.raw_get("/Pages")),
+                infile_name,
+                self.options.object_streams,
+            )
+        elif not self.options.remove_duplicates:
+            self.streamer = PdfPageStreamer(
+                self.writer,
+                outfile,
+                reader.pdf_header,
+                self.options,
+                reader if self.copy_pages else None,
+            )
 
         if in_size is None:
             in_size = reader.size
@@ -399,117 +931,345 @@ class PdfTransform(DocumentTransform):
     def pages(self) -> int:
         return len(self.reader.pages)
 
-    def write_header(self, maxpage: int, modulo: int) -> None:
+    def page_size(self, n: int) -> Rectangle | None:
+        return self.reader.geometry.media_size(n)
+
+    def chunk_transform(self, outfile: IO[bytes]) -> "PdfTransform":
+        return PdfTransform(
+            self.reader,
+            outfile,
+            self.size,
+            self.in_size,
+            self.specs,
+            self.draw,
+            self.options,
+            self.infile_name,
+        )
+
+    # Get an input page, ready to be copied or merged into the output at the
+    # given scale.
+    def input_page(self, n: int, scale: float = 1.0) -> PageObject:
+        dpi = self.options.image_dpi
+        if not self.options.prune_resources and dpi is None:
+            return self.reader.pages[n]
+        key = (n, scale if dpi is not None else 1.0)
+        if key not in self.prepared_pages:
+            page = self.reader.pages[n]
+            if self.options.prune_resources:
+                page = prune_resources(page)
+            if dpi is not None:
+                page = downsample_images(page, scale, dpi, self.resampled_image)
+            self.prepared_pages[key] = page
+        return self.prepared_pages[key]
+
+    # Get an input page to merge into an output page, as a page that draws
+    # its shared content if it has some.
+    def shared_page(self, n: int, scale: float) -> PageObject:
+        if self.shared is None or n not in self.shared:
+            return self.input_page(n, scale)
+        key = (self.shared[n], scale if self.options.image_dpi is not None else 1.0)
+        if key not in self.forms:
+            self.forms[key] = form_page(self.input_page(n, scale), self.writer)
+        return self.forms[key]
+
+    # Add an output page that is a copy of input page `n', sharing the
+    # content stream of the first copied page with the same content.
+    def add_page(self, n: int, page: PageObject) -> None:
+        if self.shared is None or n not in self.shared:
+            self.writer.add_page(page)
+            return
+        index = self.shared[n]
+        if index in self.shared_contents:
+            new_page = PageObject(page.pdf, page.indirect_reference)
+            new_page.update(page)
+            new_page[NameObject("/Contents")] = self.shared_contents[index]
+            page = new_page
+        added = self.writer.add_page(page)
+        if "/Contents" in added:
+            self.shared_contents.setdefault(index, added.raw_get("/Contents"))
+
+    # Add an input image, resampled to the given size, to the output, and
+    # return a reference to it. Each image is resampled to each size once.
+    def resampled_image(
+        self, ref: IndirectObject, width: int, height: int
+    ) -> IndirectObject:
+        key = (ref.idnum, width, height)
+        if key not in self.resampled_images:
+            image = resample_image(cast(StreamObject, ref.get_object()), width, height)
+            self.resampled_images[key] = self.writer._add_object(image)
+        return self.resampled_images[key]
+
+    # Place an input page on an output page according to `spec' by setting
+    # its attributes, without touching its content: the rotation becomes
+    # /Rotate, the scale /UserUnit, and the offset and output page size
+    # /MediaBox. Return None if this is not possible.
+    def placed_page(self, n: int, spec: PageSpec) -> PageObject | None:
+        input_page = self.reader.pages[n]
+        if (
+            spec.hflip
+            or spec.vflip
+            or spec.rotate % 90 != 0
+            or spec.scale <= 0
+            or self.size.width is None
+            or self.size.height is None
+            or self.reader.geometry.rotation(n) != 0
+            or input_page.user_unit != 1
+        ):
+            return None
+        # Map the corners of the output page back to input page coordinates
+        corners = []
+        for x, y in ((0.0, 0.0), (self.size.width, self.size.height)):
+            x, y = (x - spec.off.x) / spec.scale, (y - spec.off.y) / spec.scale
+            for _ in range(spec.rotate % 360 // 90):
+                x, y = y, -x
+            corners.append((x, y))
+        (x1, y1), (x2, y2) = corners
+        media = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+        # The output page must not show anything that the input page does
+        # not, so its media box must lie within the input's media and crop
+        # boxes, give or take rounding of less than a point; otherwise the
+        # page must be clipped.
+        for box in (
+            self.reader.geometry.media_box(n),
+            self.reader.geometry.crop_box(n),
+        ):
+            if box is not None and (
+                media[0] < box[0] - 1
+                or media[1] < box[1] - 1
+                or media[2] > box[2] + 1
+                or media[3] > box[3] + 1
+            ):
+                return None
+        page = self.input_page(n, spec.scale)
+        new_page = PageObject(page.pdf, page.indirect_reference)
+        new_page.update(page)
+        for box in ("/CropBox", "/BleedBox", "/TrimBox", "/ArtBox"):
+            if box in new_page:
+                del new_page[box]
+        new_page.mediabox = RectangleObject(media)
+        new_page[NameObject("/Rotate")] = NumberObject(-spec.rotate % 360)
+        if spec.scale != 1.0:
+            new_page[NameObject("/UserUnit")] = FloatObject(spec.scale)
+            # /UserUnit was introduced in PDF 1.6
+            if self.writer.pdf_header < "%PDF-1.6":
+                self.writer.pdf_header = "%PDF-1.6"
+        return new_page
+
+    def write_header(self, plan: ImpositionPlan) -> None:
         pass
 
     def write_page_comment(self, pagelabel: str, outputpage: int) -> None:
         pass
 
-    def write_page(
-        self,
-        page_list: PageList,
-        outputpage: int,
-        page_specs: list[PageSpec],
-        maxpage: int,
-        modulo: int,
-        pagebase: int,
-    ) -> None:
-        assert self.in_size
-        page_number = page_index_to_page_number(
-            page_specs[0], maxpage, modulo, pagebase
+    def start_pages(self, plan: ImpositionPlan) -> None:
+        if self.updater is not None or not self.use_workers():
+            return
+        # Find the output pages that must be composed
+        pages = []
+        for outputpage in range(1, plan.num_pages() + 1):
+            placements = plan.placements(outputpage)
+            page = self.output_page(placements)
+            if page is None and any(real_page >= 0 for _, real_page in placements):
+                pages.append(outputpage)
+            else:
+                self.output_pages[outputpage] = page
+        if len(pages) < 2:
+            return
+        self.submit_pages(
+            pages,
+            compose_pdf_pages,
+            self.infile_name,
+            self.size,
+            self.in_size,
+            self.specs,
+            self.draw,
+            self.options,
+            plan,
         )
-        real_page = page_list.real_page(page_number)
+
+    # Return the input page, placed if necessary, that forms an output page
+    # on its own, or None if the output page must be composed.
+    def output_page(self, placements: list[Placement]) -> PageObject | None:
+        assert self.in_size
+        if len(placements) != 1 or placements[0].page < 0 or self.draw != 0:
+            return None
+        spec, real_page = placements[0]
         if (
-            len(page_specs) == 1
-            and not page_specs[0].has_transform()
-            and page_number < page_list.num_pages()
-            and 0 <= real_page < len(self.reader.pages)
-            and self.draw == 0
+            not spec.has_transform()
             and self.size == self.in_size
             and (
                 self.in_size.width is None
-                or (
-                    self.in_size.width == self.reader.pages[real_page].mediabox.width
-                    and self.in_size.height
-                    == self.reader.pages[real_page].mediabox.height
-                )
+                or self.in_size == self.reader.geometry.media_size(real_page)
             )
         ):
-            self.writer.add_page(self.reader.pages[real_page])
+            return self.input_page(real_page)
+        return self.placed_page(real_page, spec)
+
+    def write_page(self, plan: ImpositionPlan, outputpage: int) -> None:
+        assert self.in_size
+        if outputpage in self.composed:
+            future, index = self.composed.pop(outputpage)
+            if self.chunk is None or self.chunk[0] is not future:
+                self.chunk = (future, PdfReader(io.BytesIO(future.result())))
+            self.writer.add_page(self.chunk[1].pages[index])
+            if self.streamer is not None:
+                self.streamer.add_page()
+            return
+        placements = plan.placements(outputpage)
+        if self.options.dedupe_pages and self.shared is None:
+            self.shared = self.find_shared_pages(
+                plan, lambda n: content_key(self.reader.pages[n])
+            )
+        if outputpage in self.output_pages:
+            page = self.output_pages.pop(outputpage)
+        else:
+            page = self.output_page(placements)
+        if self.updater is not None:
+            if page is None:
+                if any(real_page >= 0 for _, real_page in placements):
+                    die("--incremental cannot be used when pages are transformed")
+                self.updater.add_blank_page(self.size.width, self.size.height)
+            else:
+                self.updater.add_page(page)
+            return
+        if page is not None:
+            if self.streamer is not None and self.copy_pages:
+                self.streamer.copy_page(page)
+                return
+            self.add_page(placements[0].page, page)
         else:
             # Add a blank page of the correct size to the end of the document
             outpdf_page = self.writer.add_blank_page(self.size.width, self.size.height)
-            for spec in page_specs:
-                page_number = page_index_to_page_number(spec, maxpage, modulo, pagebase)
-                real_page = page_list.real_page(page_number)
-                if page_number < page_list.num_pages() and 0 <= real_page < len(
-                    self.reader.pages
-                ):
-                    # Calculate input page transformation
-                    t = Transformation()
-                    if spec.hflip:
-                        t = t.transform(
-                            Transformation((-1, 0, 0, 1, self.in_size.width, 0))
-                        )
-                    elif spec.vflip:
-                        t = t.transform(
-                            Transformation((1, 0, 0, -1, 0, self.in_size.height))
-                        )
-                    if spec.rotate != 0:
-                        t = t.rotate(spec.rotate % 360)
-                    if spec.scale != 1.0:
-                        t = t.scale(spec.scale, spec.scale)
-                    if spec.off != Offset(0.0, 0.0):
-                        t = t.translate(spec.off.x, spec.off.y)
+            for spec, real_page in placements:
+                if real_page >= 0:
                     # Merge input page into the output document
-                    outpdf_page.merge_transformed_page(self.reader.pages[real_page], t)
+                    outpdf_page.merge_transformed_page(
+                        self.shared_page(real_page, spec.scale),
+                        spec_transformation(spec, self.in_size),
+                    )
                     if self.draw > 0:  # FIXME: draw the line at the requested width
-                        mediabox = self.reader.pages[real_page].mediabox
+                        mediabox = self.reader.geometry.media_box(real_page)
+                        assert mediabox is not None
+                        left, bottom, right, top = mediabox
+                        x, y = spec.off.x, spec.off.y
                         line = PolyLine(
                             vertices=[
-                                (
-                                    mediabox.left + spec.off.x,
-                                    mediabox.bottom + spec.off.y,
-                                ),
-                                (mediabox.left + spec.off.x, mediabox.top + spec.off.y),
-                                (
-                                    mediabox.right + spec.off.x,
-                                    mediabox.top + spec.off.y,
-                                ),
-                                (
-                                    mediabox.right + spec.off.x,
-                                    mediabox.bottom + spec.off.y,
-                                ),
-                                (
-                                    mediabox.left + spec.off.x,
-                                    mediabox.bottom + spec.off.y,
-                                ),
+                                (left + x, bottom + y),
+                                (left + x, top + y),
+                                (right + x, top + y),
+                                (right + x, bottom + y),
+                                (left + x, bottom + y),
                             ],
                         )
                         self.writer.add_annotation(outpdf_page, line)
+        if self.streamer is not None:
+            self.streamer.add_page()
 
     def finalize(self) -> None:
-        # PyPDF seeks, so write to a buffer first in case outfile is stdout.
-        buf = io.BytesIO()
-        self.writer.write(buf)
-        buf.seek(0)
-        self.outfile.write(buf.read())
-        self.outfile.flush()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.updater is not None:
+            self.updater.finish_update(self.writer.pdf_header)
+        elif self.streamer is not None:
+            self.streamer.finish()
+        else:
+            write_pdf_document(self.writer, self.outfile, self.options)
+
+
+# Compose the given output pages of a PdfTransform in a worker process,
+# reading the input document through a read-only memory map, and return
+# them as a PDF document. The document is only an intermediate result, so
+# the output options that affect only how it is written are not applied.
+def compose_pdf_pages(
+    infile_name: str,
+    size: Rectangle | None,
+    in_size: Rectangle | None,
+    specs: list[list[PageSpec]],
+    draw: float,
+    options: TransformOptions,
+    plan: ImpositionPlan,
+    pages: list[int],
+) -> bytes:
+    options = replace(
+        options,
+        compress_level=None,
+        object_streams=False,
+        remove_duplicates=False,
+        jobs=1,
+    )
+    with (
+        open(infile_name, "rb") as infile,
+        mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data,
+    ):
+        outfile = io.BytesIO()
+        transform = PdfTransform(
+            PdfReader(cast(IO[bytes], data)),
+            outfile,
+            size,
+            in_size,
+            specs,
+            draw,
+            options,
+        )
+        for outputpage in pages:
+            transform.write_page(plan, outputpage)
+        transform.finalize()
+        del transform
+    return outfile.getvalue()
+
+
+# Concatenate PDF documents, adding a blank page to each document with an
+# odd number of pages if `even' is set.
+def join_pdf(
+    infiles: list[IO[bytes]],
+    outfile: IO[bytes],
+    even: bool,
+    options: TransformOptions | None = None,
+) -> None:
+    out_pdf = PdfWriter()
+    for file in infiles:
+        in_pdf = PdfReader(file)
+        out_pdf.append(in_pdf)
+        if even and len(in_pdf.pages) % 2 == 1:
+            out_pdf.add_blank_page()
+    write_pdf_document(
+        out_pdf, outfile, options if options is not None else TransformOptions()
+    )
+
+
+register_pdf_engine(
+    PdfEngine("pypdf", PdfReader, PdfTransform, join_pdf, lambda options, draw: True)
+)
 
 
 def document_transform(
-    indoc: PdfReader | PsReader,
+    indoc: PdfDocument | PsReader,
     outfile: IO[bytes],
     size: Rectangle | None,
     in_size: Rectangle | None,
     specs: list[list[PageSpec]],
     draw: float,
     in_size_guessed: bool,
-) -> PdfTransform | PsTransform:
+    options: TransformOptions | None = None,
+    infile_name: str | None = None,
+) -> DocumentTransform:
     if isinstance(indoc, PsReader):
-        return PsTransform(indoc, outfile, size, in_size, specs, draw, in_size_guessed)
-    if isinstance(indoc, PdfReader):
-        return PdfTransform(indoc, outfile, size, in_size, specs, draw)
+        return PsTransform(
+            indoc,
+            outfile,
+            size,
+            in_size,
+            specs,
+            draw,
+            in_size_guessed,
+            options,
+            infile_name,
+        )
+    engine = document_engine(indoc)
+    if engine is not None:
+        return engine.transform(
+            indoc, outfile, size, in_size, specs, draw, options, infile_name
+        )
     die("unknown document type")
 
 
@@ -522,13 +1282,27 @@ def file_transform(
     specs: list[list[PageSpec]],
     draw: float,
     in_size_guessed: bool,
-) -> Iterator[PdfTransform | PsTransform]:
-    with setup_input_and_output(infile_name, outfile_name) as (
+    options: TransformOptions | None = None,
+    split: int | list[Range] | None = None,
+) -> Iterator[DocumentTransform]:
+    # When the output is split, the output files are opened by write_split.
+    infile, file_type = read_input(infile_name)
+    with (
         infile,
-        file_type,
-        outfile,
+        io.BytesIO() if split is not None else open_output(outfile_name) as outfile,
     ):
-        doc = document_reader(infile, file_type)
-        yield document_transform(
-            doc, outfile, size, in_size, specs, draw, in_size_guessed
+        doc = document_reader(infile, file_type, options, draw)
+        transform = document_transform(
+            doc,
+            outfile,
+            size,
+            in_size,
+            specs,
+            draw,
+            in_size_guessed,
+            options,
+            infile_name if infile_name != "-" else None,
         )
+        if split is not None:
+            transform.split = (split, outfile_name)
+        yield transform
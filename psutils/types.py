@@ -4,8 +4,12 @@ Copyright (c) Reuben Thomas 2023.
 Released under the GPL version 3, or (at your option) any later version.
 """
 
-from dataclasses import dataclass
-from typing import NamedTuple
+import math
+from array import array
+from bisect import bisect_right
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import astuple, dataclass
+from typing import Any, NamedTuple, overload
 
 from .warnings import die
 
@@ -51,6 +55,111 @@ class PageSpec:
         )
 
 
+@dataclass
+class TransformOptions:
+    prune_resources: bool = False
+    compress_level: int | None = None
+    object_streams: bool = False
+    remove_duplicates: bool = False
+    dedupe_pages: bool = False
+    minify: bool = False
+    compress_pages: bool = False
+    image_dpi: float | None = None
+    incremental: bool = False
+    pdf_engine: str | None = None
+    jobs: int = 1
+
+
+# A box on a page: left, bottom, right and top
+Box = tuple[float, float, float, float]
+
+
+# The geometry of a page as read from a document; boxes that are not
+# given are None.
+class PageBoxes(NamedTuple):
+    media: Box | None = None
+    crop: Box | None = None
+    trim: Box | None = None
+    bbox: Box | None = None
+    rotate: int = 0
+
+
+# The geometry of each page of a document: its media, crop and trim boxes
+# and, for PostScript, its bounding box, each held as four numbers per
+# page in an array, with NaN for a box that is not known, and its
+# rotation. If `read_page' is given, it is called to read the geometry of
+# each page the first time it is needed, so that only the pages that are
+# used are read.
+class PageGeometry:
+    def __init__(
+        self,
+        num_pages: int,
+        read_page: Callable[[int], PageBoxes] | None = None,
+    ) -> None:
+        unknown = array("d", [math.nan] * 4) * num_pages
+        self.media = unknown
+        self.crop = array("d", unknown)
+        self.trim = array("d", unknown)
+        self.bbox = array("d", unknown)
+        self.rotate = array("h", bytes(num_pages * array("h").itemsize))
+        self.read_page = read_page
+        self.loaded = bytearray(num_pages)
+
+    def __len__(self) -> int:
+        return len(self.rotate)
+
+    def set_page(self, n: int, boxes: PageBoxes) -> None:
+        for boxes_array, box in (
+            (self.media, boxes.media),
+            (self.crop, boxes.crop),
+            (self.trim, boxes.trim),
+            (self.bbox, boxes.bbox),
+        ):
+            if box is not None:
+                boxes_array[4 * n : 4 * n + 4] = array("d", box)
+        self.rotate[n] = boxes.rotate % 360
+        self.loaded[n] = 1
+
+    def load(self, n: int) -> None:
+        if self.read_page is not None and not self.loaded[n]:
+            self.set_page(n, self.read_page(n))
+
+    def box(self, boxes_array: "array[float]", n: int) -> Box | None:
+        self.load(n)
+        left, bottom, right, top = boxes_array[4 * n : 4 * n + 4]
+        if math.isnan(left):
+            return None
+        return left, bottom, right, top
+
+    def media_box(self, n: int) -> Box | None:
+        return self.box(self.media, n)
+
+    def crop_box(self, n: int) -> Box | None:
+        return self.box(self.crop, n)
+
+    def trim_box(self, n: int) -> Box | None:
+        return self.box(self.trim, n)
+
+    def bounding_box(self, n: int) -> Box | None:
+        return self.box(self.bbox, n)
+
+    def rotation(self, n: int) -> int:
+        self.load(n)
+        return self.rotate[n]
+
+    # The size of the media of page `n', or None if it is not known.
+    def media_size(self, n: int) -> Rectangle | None:
+        box = self.media_box(n)
+        if box is None:
+            return None
+        left, bottom, right, top = box
+        return Rectangle(right - left, top - bottom)
+
+
+# A list of input pages, numbered from 0, with -1 for an inserted blank
+# page. The pages are held as a list of segments, each a range or other
+# sequence that computes its elements, so that a range such as `1-_1'
+# takes constant space.
 class PageList:
     def __init__(
         self,
@@ -60,27 +169,306 @@ class PageList:
         odd: bool,
         even: bool,
     ) -> None:
-        self.pages: list[int] = []
+        segments: list[Sequence[int]] = []
         for range_ in pagerange:
+            if max(range_.start, range_.end) > total_pages:
+                die(f"page range {range_.text} is invalid", 2)
             inc = -1 if range_.end < range_.start else 1
-            currentpg = range_.start
-            while range_.end - currentpg != -inc:
-                if currentpg > total_pages:
-                    die(f"page range {range_.text} is invalid", 2)
-                if not (odd and (not even) and currentpg % 2 == 0) and not (
-                    even and not odd and currentpg % 2 == 1
-                ):
-                    self.pages.append(currentpg - 1)
-                currentpg += inc
+            pages = range(range_.start - 1, range_.end - 1 + inc, inc)
+            # Keep only odd or even page numbers, if asked.
+            if odd != even and len(pages) > 0:
+                parity = 0 if odd else 1
+                pages = pages[(pages[0] - parity) % 2 :: 2]
+            segments.append(pages)
         if reverse:
-            self.pages.reverse()
+            segments = [pages[::-1] for pages in reversed(segments)]
+        self.set_segments(segments)
+
+    # Make a page list from a sequence of pages.
+    @classmethod
+    def from_pages(cls, pages: Sequence[int]) -> "PageList":
+        page_list = cls.__new__(cls)
+        page_list.set_segments([pages])
+        return page_list
+
+    def set_segments(self, segments: list[Sequence[int]]) -> None:
+        self.segments = [pages for pages in segments if len(pages) > 0]
+        # The index of the first page of each segment, and the total
+        self.offsets = [0]
+        for pages in self.segments:
+            self.offsets.append(self.offsets[-1] + len(pages))
+
+    def __getitem__(self, pagenum: int) -> int:
+        if not 0 <= pagenum < self.offsets[-1]:
+            raise IndexError("page list index out of range")
+        segment = bisect_right(self.offsets, pagenum) - 1
+        return self.segments[segment][pagenum - self.offsets[segment]]
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __iter__(self) -> Iterator[int]:
+        for pages in self.segments:
+            yield from pages
 
     # Returns -1 for an inserted blank page (page number '_')
     def real_page(self, pagenum: int) -> int:
         try:
-            return self.pages[pagenum]
+            return self[pagenum]
         except IndexError:
             return 0
 
+    # Return real_page for each of a range of page list indices.
+    def real_pages(self, pagenums: range) -> list[int]:
+        if len(self.segments) == 1:
+            pages = self.segments[0]
+            return [pages[n] if n < len(pages) else 0 for n in pagenums]
+        return [self.real_page(n) for n in pagenums]
+
     def num_pages(self) -> int:
-        return len(self.pages)
+        return len(self)
+
+
+# The order of the pages of a document folded into signatures of
+# `signature' pages each (0 meaning the whole document in one signature),
+# with -1 for the blank pages that fill up the last signature. Each page
+# is computed when it is indexed, so the order takes constant space.
+class SignatureOrder(Sequence[int]):
+    def __init__(self, total_pages: int, signature: int) -> None:
+        if signature == 0:
+            signature = total_pages + (4 - total_pages % 4) % 4
+        self.total_pages = total_pages
+        self.signature = signature
+        self.maxpage = total_pages + (signature - total_pages % signature) % signature
+
+    def real_page(self, page_number: int) -> int:
+        real_page = page_number - page_number % self.signature
+        page_on_sheet = page_number % 4
+        recto_verso = (page_number % self.signature) // 2
+        if page_on_sheet in (0, 3):
+            real_page += self.signature - 1 - recto_verso
+        else:
+            real_page += recto_verso
+        return real_page if real_page < self.total_pages else -1
+
+    @overload
+    def __getitem__(self, index: int) -> int: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[int]: ...
+
+    def __getitem__(self, index: int | slice) -> int | list[int]:
+        if isinstance(index, slice):
+            return [self.real_page(n) for n in range(self.maxpage)[index]]
+        if index < 0:
+            index += self.maxpage
+        if not 0 <= index < self.maxpage:
+            raise IndexError("signature order index out of range")
+        return self.real_page(index)
+
+    def __len__(self) -> int:
+        return self.maxpage
+
+
+# A range of pages to be rearranged with its own page specs
+class SpecSection(NamedTuple):
+    pagerange: list[Range] | None
+    specs: list[list[PageSpec]]
+    modulo: int
+
+
+def page_index_to_page_number(
+    spec: PageSpec, maxpage: int, modulo: int, pagebase: int
+) -> int:
+    return (maxpage - pagebase - modulo if spec.reversed else pagebase) + spec.pageno
+
+
+class Placement(NamedTuple):
+    spec: PageSpec
+    page: int  # The input page placed, or -1 for none
+
+
+# The placement of input pages on output pages. Each placement of a page
+# spec on an output page is an element of parallel arrays, which hold the
+# output page, the spec's slot on it, the input page placed (or -1 if
+# none), the spec, as an index into `spec_list', and the input page used
+# to label it, which differs from the page placed for blank pages.
+# `start' holds the index of the first placement of each output page,
+# followed by the total number of placements.
+class ImpositionPlan:
+    # Plan the placement of the pages in `page_list' by `specs'.
+    # The arrays are filled a column at a time: the placements of each spec
+    # form an arithmetic progression of page list positions, one per block
+    # of `modulo' pages.
+    def __init__(
+        self,
+        page_list: PageList,
+        total_pages: int,
+        specs: list[list[PageSpec]],
+        modulo: int,
+    ) -> None:
+        listed_pages = page_list.num_pages()
+        # Highest page number output (including any blanks)
+        maxpage = listed_pages + (modulo - listed_pages % modulo) % modulo
+        self.spec_list = [spec for page_specs in specs for spec in page_specs]
+        blocks = maxpage // modulo
+        size = blocks * len(self.spec_list)
+        self.output_page = array("l", bytes(size * array("l").itemsize))
+        self.slot = array("l", self.output_page)
+        self.source_page = array("l", self.output_page)
+        self.spec = array("l", self.output_page)
+        self.label_page = array("l", self.output_page)
+        index = 0
+        page_start = []
+        for page_index, page_specs in enumerate(specs):
+            page_start.append(index)
+            for slot, spec in enumerate(page_specs):
+                column = slice(index, size, len(self.spec_list))
+                first = page_index_to_page_number(spec, maxpage, modulo, 0)
+                step = -modulo if spec.reversed else modulo
+                numbers = range(first, first + blocks * step, step)
+                label_pages = page_list.real_pages(numbers)
+                self.label_page[column] = array("l", label_pages)
+                self.source_page[column] = array(
+                    "l",
+                    [
+                        p if n < listed_pages and 0 <= p < total_pages else -1
+                        for n, p in zip(numbers, label_pages)
+                    ],
+                )
+                self.output_page[column] = array(
+                    "l",
+                    range(
+                        page_index + 1,
+                        blocks * len(specs) + 1,
+                        len(specs),
+                    ),
+                )
+                self.slot[column] = array("l", [slot]) * blocks
+                self.spec[column] = array("l", [index]) * blocks
+                index += 1
+        self.start = array(
+            "l",
+            [
+                block + page_index
+                for block in range(0, size, len(self.spec_list))
+                for page_index in page_start
+            ],
+        )
+        self.start.append(size)
+
+    # Make a plan from the placements on each output page, each given with
+    # the input page used to label it.
+    @classmethod
+    def from_placements(
+        cls, pages: Iterable[list[tuple[Placement, int]]]
+    ) -> "ImpositionPlan":
+        plan = cls.__new__(cls)
+        plan.spec_list = []
+        spec_index: dict[tuple[Any, ...], int] = {}
+        plan.output_page = array("l")
+        plan.slot = array("l")
+        plan.source_page = array("l")
+        plan.spec = array("l")
+        plan.label_page = array("l")
+        plan.start = array("l")
+        for outputpage, placements in enumerate(pages, 1):
+            plan.start.append(len(plan.source_page))
+            for slot, ((spec, page), label_page) in enumerate(placements):
+                key = astuple(spec)
+                if key not in spec_index:
+                    spec_index[key] = len(plan.spec_list)
+                    plan.spec_list.append(spec)
+                plan.output_page.append(outputpage)
+                plan.slot.append(slot)
+                plan.source_page.append(page)
+                plan.spec.append(spec_index[key])
+                plan.label_page.append(label_page)
+        plan.start.append(len(plan.source_page))
+        return plan
+
+    # Make a plan that writes the output pages of each of `plans' in turn.
+    @classmethod
+    def concatenate(cls, plans: list["ImpositionPlan"]) -> "ImpositionPlan":
+        if len(plans) == 1:
+            return plans[0]
+        plan = cls.__new__(cls)
+        plan.spec_list = []
+        plan.output_page = array("l")
+        plan.slot = array("l")
+        plan.source_page = array("l")
+        plan.spec = array("l")
+        plan.label_page = array("l")
+        plan.start = array("l")
+        for part in plans:
+            first_spec = len(plan.spec_list)
+            first_page = plan.num_pages() if len(plan.start) > 0 else 0
+            first_placement = len(plan.source_page)
+            plan.spec_list.extend(part.spec_list)
+            plan.output_page.extend(n + first_page for n in part.output_page)
+            plan.slot.extend(part.slot)
+            plan.source_page.extend(part.source_page)
+            plan.spec.extend(n + first_spec for n in part.spec)
+            plan.label_page.extend(part.label_page)
+            plan.start[len(plan.start) - 1 :] = array(
+                "l", (n + first_placement for n in part.start)
+            )
+        return plan
+
+    # Make a plan that writes the given output pages of this plan, in turn.
+    def extract(self, outputpages: Iterable[int]) -> "ImpositionPlan":
+        plan = ImpositionPlan.__new__(ImpositionPlan)
+        plan.spec_list = self.spec_list
+        plan.output_page = array("l")
+        plan.slot = array("l")
+        plan.source_page = array("l")
+        plan.spec = array("l")
+        plan.label_page = array("l")
+        plan.start = array("l")
+        for new_outputpage, outputpage in enumerate(outputpages, 1):
+            first, last = self.start[outputpage - 1], self.start[outputpage]
+            plan.start.append(len(plan.source_page))
+            plan.output_page.extend(array("l", [new_outputpage]) * (last - first))
+            plan.slot.extend(self.slot[first:last])
+            plan.source_page.extend(self.source_page[first:last])
+            plan.spec.extend(self.spec[first:last])
+            plan.label_page.extend(self.label_page[first:last])
+        plan.start.append(len(plan.source_page))
+        return plan
+
+    def num_pages(self) -> int:
+        return len(self.start) - 1
+
+    # The range of placements on an output page, numbered from 1.
+    def page_placements(self, outputpage: int) -> range:
+        return range(self.start[outputpage - 1], self.start[outputpage])
+
+    # Return the placements on an output page.
+    def placements(self, outputpage: int) -> list[Placement]:
+        return [
+            Placement(self.spec_list[self.spec[i]], self.source_page[i])
+            for i in self.page_placements(outputpage)
+        ]
+
+    # Return the placements on an output page, each with its label page.
+    def labelled_placements(self, outputpage: int) -> list[tuple[Placement, int]]:
+        return [
+            (
+                Placement(self.spec_list[self.spec[i]], self.source_page[i]),
+                self.label_page[i],
+            )
+            for i in self.page_placements(outputpage)
+        ]
+
+    # Return the label of an output page, made from its input page numbers.
+    def label(self, outputpage: int) -> str:
+        return ",".join(
+            str(self.label_page[i] + 1) if self.label_page[i] >= 0 else "*"
+            for i in self.page_placements(outputpage)
+        )
+
+    # Whether any output page is not simply a copy of an input page.
+    def transforms_pages(self) -> bool:
+        return any(spec.has_transform() for spec in self.spec_list) or any(
+            self.start[i + 1] - self.start[i] > 1 for i in range(self.num_pages())
+        )
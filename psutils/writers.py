@@ -0,0 +1,648 @@
+"""PSUtils document writer classes.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import io
+import os
+import shutil
+import zlib
+from collections import deque
+from typing import IO, cast
+
+from pypdf import PageObject, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    PdfObject,
+    StreamObject,
+)
+
+from .readers import PdfReader, RawObject
+from .types import TransformOptions
+
+
+# Maximum number of objects packed into each object stream
+OBJECTS_PER_STREAM = 100
+
+
+# Write PDF objects to a file, renumbering them as they are added.
+# Objects other than streams can be packed into compressed object streams,
+# in which case the cross-reference table is written as a stream too.
+# Objects of the `source' document are copied from it byte for byte where
+# possible, only renumbering the references in them, rather than being
+# parsed and serialized. References in them to its pages and page tree
+# nodes are not followed: see `ref'.
+class PdfObjectWriter:
+    def __init__(
+        self,
+        outfile: IO[bytes],
+        version: str = "%PDF-1.3",
+        object_streams: bool = False,
+        level: int = -1,
+        source: PdfReader | None = None,
+    ) -> None:
+        self.outfile = outfile
+        self.object_streams = object_streams
+        self.level = level
+        self.source = source
+        # The number of the page tree node that the pages of `source' are
+        # put in
+        self.page_tree: int | None = None
+        self.copied_pages: set[int] = set()
+        self.offset = 0
+        # Cross-reference entries, indexed by object number - 1:
+        # (1, offset) for an object in the file, or (2, object stream
+        # number, index) for an object in an object stream.
+        self.xref: list[tuple[int, ...]] = []
+        self.numbers: dict[tuple[int, int, int], int] = {}
+        self.pending: deque[tuple[int, PdfObject | RawObject | None]] = deque()
+        self.packed: list[tuple[int, bytes]] = []
+        # The number of the first object
+        self.first = 1
+        if object_streams and version < "%PDF-1.5":
+            version = "%PDF-1.5"
+        self.write_header(version)
+
+    def write_header(self, version: str) -> None:
+        self.write(version.encode() + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    def write(self, data: bytes) -> None:
+        self.outfile.write(data)
+        self.offset += len(data)
+
+    # Allocate an object number.
+    def reserve(self) -> int:
+        self.xref.append((0, 0))
+        return self.first + len(self.xref) - 1
+
+    # Return the output object number for an indirect reference, queueing
+    # the object it refers to to be written if it has not been seen before.
+    # A reference to a page of `source' is given a number for the page to be
+    # copied with `copy_page'; if it is not, the object is written as null.
+    # References to page tree nodes refer to `page_tree'.
+    def ref(self, ref: IndirectObject) -> int:
+        num = self.numbers.get(self.key(ref))
+        if num is None:
+            raw = None
+            if self.source is not None and ref.pdf is self.source:
+                raw = self.source.raw_object(ref)
+            if raw is not None and raw.type == b"/Pages" and self.page_tree is not None:
+                num = self.numbers[self.key(ref)] = self.page_tree
+            elif raw is not None and raw.type == b"/Page":
+                num = self.reserve_ref(ref)
+            else:
+                num = self.reserve_ref(ref)
+                self.pending.append((num, raw if raw is not None else ref.get_object()))
+        return num
+
+    def key(self, ref: IndirectObject) -> tuple[int, int, int]:
+        return (id(ref.pdf), ref.idnum, ref.generation)
+
+    # Allocate an object number for an indirect reference without queueing
+    # the object it refers to, which must be written later with `add'.
+    def reserve_ref(self, ref: IndirectObject) -> int:
+        num = self.reserve()
+        self.numbers[self.key(ref)] = num
+        return num
+
+    def numbered(self, ref: IndirectObject) -> bool:
+        return self.key(ref) in self.numbers
+
+    def reference(self, ref: IndirectObject) -> bytes:
+        return b"%d 0 R" % self.ref(ref)
+
+    def serialize(self, obj: PdfObject | None, out: IO[bytes]) -> None:
+        if isinstance(obj, IndirectObject):
+            out.write(self.reference(obj))
+        elif isinstance(obj, StreamObject):
+            data = obj.get_data() if isinstance(obj, ContentStream) else obj._data
+            out.write(b"<<")
+            for key, value in obj.items():
+                if key != "/Length":
+                    key.write_to_stream(out)
+                    out.write(b" ")
+                    self.serialize(value, out)
+                    out.write(b"\n")
+            out.write(b"/Length %d>>\nstream\n" % len(data))
+            out.write(data)
+            out.write(b"\nendstream")
+        elif isinstance(obj, DictionaryObject):
+            out.write(b"<<")
+            for key, value in obj.items():
+                key.write_to_stream(out)
+                out.write(b" ")
+                self.serialize(value, out)
+                out.write(b"\n")
+            out.write(b">>")
+        elif isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for value in obj:
+                self.serialize(value, out)
+                out.write(b" ")
+            out.write(b"]")
+        elif obj is None:
+            out.write(b"null")
+        else:
+            obj.write_to_stream(out)
+
+    # Write the object with the given number, and all the objects it
+    # refers to that have not already been written.
+    def add(self, obj: PdfObject, num: int | None = None) -> int:
+        if num is None:
+            ref = getattr(obj, "indirect_reference", None)
+            if ref is not None:
+                num = self.ref(ref)
+            else:
+                num = self.reserve()
+                self.pending.append((num, obj))
+        else:
+            self.pending.append((num, obj))
+        while len(self.pending) > 0:
+            self.write_object(*self.pending.popleft())
+        return num
+
+    # Copy a page of `source', which may have had its attributes changed,
+    # and the objects it refers to. A page that is copied more than once is
+    # given a new number each time after the first.
+    def copy_page(self, page: PageObject) -> int:
+        ref = cast(IndirectObject, page.indirect_reference)
+        num = self.numbers.get(self.key(ref))
+        if num is None:
+            num = self.reserve_ref(ref)
+        elif num in self.copied_pages:
+            num = self.reserve()
+        self.copied_pages.add(num)
+        return self.add(page, num)
+
+    def write_object(self, num: int, obj: PdfObject | RawObject | None) -> None:
+        if isinstance(obj, RawObject):
+            data = b"".join(
+                piece if isinstance(piece, bytes) else self.reference(piece)
+                for piece in obj.pieces
+            )
+            if obj.stream is not None:
+                data += b"\nstream\n" + obj.stream + b"\nendstream"
+            self.write_data(num, data or b"null", obj.stream is not None)
+        else:
+            buf = io.BytesIO()
+            self.serialize(obj, buf)
+            self.write_data(num, buf.getvalue(), isinstance(obj, StreamObject))
+
+    # Write the data of an object, packing it into an object stream unless
+    # it is a stream.
+    def write_data(self, num: int, data: bytes, stream: bool) -> None:
+        if self.object_streams and not stream:
+            self.packed.append((num, data))
+            if len(self.packed) >= OBJECTS_PER_STREAM:
+                self.flush_object_stream()
+        else:
+            self.write_raw(num, data)
+
+    def write_raw(self, num: int, data: bytes) -> None:
+        self.xref[num - self.first] = (1, self.offset)
+        self.write(b"%d 0 obj\n" % num + data + b"\nendobj\n")
+
+    def flush_object_stream(self) -> None:
+        if len(self.packed) == 0:
+            return
+        num = self.reserve()
+        index, objects = [], []
+        pos = 0
+        for i, (packed_num, data) in enumerate(self.packed):
+            self.xref[packed_num - self.first] = (2, num, i)
+            index.append(b"%d %d" % (packed_num, pos))
+            objects.append(data)
+            pos += len(data) + 1
+        header = b" ".join(index) + b"\n"
+        data = zlib.compress(header + b"\n".join(objects), self.level)
+        self.write_raw(
+            num,
+            b"<</Type/ObjStm/N %d/First %d/Filter/FlateDecode/Length %d>>\nstream\n"
+            % (len(self.packed), len(header), len(data))
+            + data
+            + b"\nendstream",
+        )
+        self.packed = []
+
+    # Write the cross-reference table and trailer. Objects whose numbers were
+    # reserved but that were never written, such as pages of `source' that
+    # were not copied, are written as null.
+    def finish(self, root: int, info: int | None = None) -> None:
+        trailer = b"/Root %d 0 R" % root
+        if info is not None:
+            trailer += b"/Info %d 0 R" % info
+        self.flush_object_stream()
+        for num, entry in enumerate(self.xref, 1):
+            if entry == (0, 0):
+                self.write_raw(num, b"null")
+        if self.object_streams:
+            num = self.reserve()
+            self.xref[num - 1] = (1, self.offset)
+            width = max(1, (self.offset.bit_length() + 7) // 8)
+            rows = [b"\x00" + b"\x00" * width + b"\xff\xff"]
+            for entry in self.xref:
+                if entry[0] == 1:
+                    rows.append(b"\x01" + entry[1].to_bytes(width) + b"\x00\x00")
+                else:
+                    rows.append(
+                        b"\x02" + entry[1].to_bytes(width) + entry[2].to_bytes(2)
+                    )
+            data = zlib.compress(b"".join(rows), self.level)
+            xref_offset = self.offset
+            self.write(
+                b"%d 0 obj\n<</Type/XRef/Size %d/W[1 %d 2]/Filter/FlateDecode/Length %d%s>>\nstream\n"
+                % (num, len(self.xref) + 1, width, len(data), trailer)
+                + data
+                + b"\nendstream\nendobj\n"
+            )
+        else:
+            xref_offset = self.offset
+            rows = [b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.xref) + 1)]
+            rows.extend(b"%010d 00000 n \n" % entry[1] for entry in self.xref)
+            rows.append(b"trailer\n<</Size %d%s>>\n" % (len(self.xref) + 1, trailer))
+            self.write(b"".join(rows))
+        self.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+        self.outfile.flush()
+
+
+# Write a document built with pypdf's PdfWriter using a PdfObjectWriter.
+# Only objects reachable from the catalog and document information are
+# written.
+def write_pdf(
+    writer: PdfWriter, outfile: IO[bytes], object_streams: bool, level: int
+) -> None:
+    out = PdfObjectWriter(outfile, writer.pdf_header, object_streams, level)
+    root = out.add(writer.root_object)
+    info = None
+    if writer.metadata is not None and len(writer.metadata) > 0:
+        info = out.add(writer.metadata)
+    out.finish(root, info)
+
+
+# Compress the content streams of a page if they are not already compressed.
+# Streams that a PdfPageStreamer has already written, when they are shared
+# with an earlier page, are left as they were written.
+def compress_page_contents(page: PageObject, level: int) -> None:
+    contents = page.get("/Contents")
+    if contents is None:
+        return
+    contents = contents.get_object()
+    streams = [
+        stream.get_object()
+        for stream in (contents if isinstance(contents, ArrayObject) else [contents])
+    ]
+    if any(isinstance(stream, NullObject) for stream in streams):
+        return
+    if any("/Filter" not in stream for stream in streams):
+        page.compress_content_streams(level)
+
+
+# Compress the content streams of the pages of a document that are not
+# already compressed.
+def compress_content_streams(writer: PdfWriter, level: int) -> None:
+    for page in writer.pages:
+        compress_page_contents(page, level)
+
+
+# Write a document built with pypdf's PdfWriter, applying the given
+# compression options.
+def write_pdf_document(
+    writer: PdfWriter, outfile: IO[bytes], options: TransformOptions
+) -> None:
+    level = options.compress_level if options.compress_level is not None else -1
+    if options.compress_level is not None:
+        compress_content_streams(writer, level)
+    if options.remove_duplicates:
+        writer.compress_identical_objects()
+    if options.object_streams:
+        write_pdf(writer, outfile, True, level)
+    else:
+        # PyPDF seeks, so write to a buffer first in case outfile is stdout.
+        buf = io.BytesIO()
+        writer.write(buf)
+        buf.seek(0)
+        outfile.write(buf.read())
+        outfile.flush()
+
+
+# Write the pages of a document being built with pypdf's PdfWriter as each
+# is completed, rather than the whole document at the end. Once written,
+# objects are replaced in the PdfWriter by placeholders that keep only their
+# references, so that the document is not held in memory. Removing
+# duplicate objects needs the whole document, so is not supported.
+# Pages of the `source' document can also be copied into the output
+# directly with `copy_page', bypassing the PdfWriter.
+class PdfPageStreamer:
+    def __init__(
+        self,
+        writer: PdfWriter,
+        outfile: IO[bytes],
+        version: str,
+        options: TransformOptions,
+        source: PdfReader | None = None,
+    ) -> None:
+        self.writer = writer
+        self.outfile = outfile
+        self.version = max(version, writer.pdf_header)
+        self.options = options
+        self.source = source
+        self.level = options.compress_level
+        self.out: PdfObjectWriter | None = None
+        self.kids: list[int] = []
+        self.released = len(writer._objects)
+        self.resolved_links = 0
+        self.link_targets: dict[IndirectObject, IndirectObject] = {}
+
+    # Start writing the document when its first page is complete, so that
+    # nothing is written if no page is.
+    def start(self) -> PdfObjectWriter:
+        if self.out is None:
+            self.version = max(self.version, self.writer.pdf_header)
+            self.out = PdfObjectWriter(
+                self.outfile,
+                self.version,
+                self.options.object_streams,
+                self.level if self.level is not None else -1,
+                self.source,
+            )
+            # The page tree is written last, but pages refer to it.
+            self.pages_ref = cast(
+                IndirectObject, self.writer.root_object.raw_get("/Pages")
+            )
+            self.out.page_tree = self.out.reserve_ref(self.pages_ref)
+        return self.out
+
+    # Copy a page of the source document to the output.
+    def copy_page(self, page: PageObject) -> None:
+        self.kids.append(self.start().copy_page(page))
+
+    # Write the last page added to the document.
+    def add_page(self) -> None:
+        page = self.writer.pages[-1]
+        ref = cast(IndirectObject, page.indirect_reference)
+        out = self.start()
+        # Links on earlier pages to the input page that this page copies
+        # refer to the number reserved for it.
+        origin = next(reversed(self.writer._merged_in_pages), None)
+        if (
+            origin is not None
+            and origin in self.link_targets
+            and self.writer._merged_in_pages[origin] == ref
+        ):
+            stray = self.link_targets.pop(origin)
+            out.numbers[out.key(ref)] = out.numbers[out.key(stray)]
+        self.resolve_links(out)
+        if self.level is not None:
+            compress_page_contents(page, self.level)
+        self.kids.append(out.add(page, out.numbers.get(out.key(ref))))
+        page.clear()
+        self.release(out)
+
+    # Point links at the pages they refer to if those pages have already been
+    # added to the document; otherwise, reserve an object number for the page
+    # that the link refers to. If the page is added later, it is given that
+    # number; if not, the copy of the target page that pypdf made is written
+    # at the end, as pypdf would.
+    def resolve_links(self, out: PdfObjectWriter) -> None:
+        links = self.writer._unresolved_links
+        for new_link, old_link in links[self.resolved_links :]:
+            target = old_link.find_referenced_page()
+            if target is None:
+                continue
+            page = self.writer._merged_in_pages.get(target)
+            if page is not None:
+                new_link.patch_reference(self.writer, page)
+            elif target not in self.link_targets:
+                stray = new_link.find_referenced_page()
+                if stray is not None and not out.numbered(stray):
+                    out.reserve_ref(stray)
+                    self.link_targets[target] = stray
+        self.resolved_links = len(links)
+
+    # Replace the objects added to the PdfWriter that have been written by
+    # placeholders.
+    def release(self, out: PdfObjectWriter) -> None:
+        objects = self.writer._objects
+        deferred = {ref.idnum for ref in self.link_targets.values()}
+        for i in range(self.released, len(objects)):
+            ref = IndirectObject(i + 1, 0, self.writer)
+            if objects[i] is not None and out.numbered(ref) and i + 1 not in deferred:
+                placeholder = NullObject()
+                placeholder.indirect_reference = ref
+                objects[i] = placeholder
+        self.released = len(objects)
+
+    # Write the page tree, catalog and trailer.
+    def finish(self) -> None:
+        out = self.start()
+        for ref in self.link_targets.values():
+            out.add(cast(PdfObject, ref.get_object()), out.numbers[out.key(ref)])
+        out.write_data(
+            out.ref(self.pages_ref),
+            b"<</Type/Pages/Kids[%s]/Count %d>>"
+            % (b" ".join(b"%d 0 R" % kid for kid in self.kids), len(self.kids)),
+            False,
+        )
+        root = self.writer.root_object
+        # Pages may have needed a later version than the one in the header.
+        if self.writer.pdf_header > self.version:
+            root[NameObject("/Version")] = NameObject(
+                "/" + self.writer.pdf_header.removeprefix("%PDF-")
+            )
+        info = None
+        if self.writer.metadata is not None and len(self.writer.metadata) > 0:
+            info = out.add(self.writer.metadata)
+        out.finish(out.add(root), info)
+
+
+# Write a document as an incremental update of `source': a copy of it,
+# followed by new versions of its catalog and of the pages that are kept, a
+# new page tree, and a cross-reference section for them. All other objects
+# are referred to by their numbers in `source', so the time taken to write
+# the update depends only on the number of pages. Each page keeps its number
+# the first time that it is written, so that links to it still work.
+# `tree' is the reference that the new page tree is written for. When
+# `source_name' is the name of the file that `source' was read from, and
+# the output is a file, it is copied with copy_file_range, which avoids
+# copying the data through memory, and may share it on file systems that
+# support copy-on-write.
+class PdfUpdateWriter(PdfObjectWriter):
+    def __init__(
+        self,
+        source: PdfReader,
+        outfile: IO[bytes],
+        tree: IndirectObject,
+        source_name: str | None = None,
+        xref_stream: bool = False,
+        level: int = -1,
+    ) -> None:
+        self.original = source
+        self.source_name = source_name
+        super().__init__(outfile, source.pdf_header, False, level)
+        # Objects of `source' that are replaced, with their generation
+        # numbers and offsets
+        self.generations: dict[int, int] = {}
+        self.replaced: dict[int, tuple[int, int]] = {}
+        self.kids: list[tuple[int, int]] = []
+        size = source.trailer.get("/Size", 0)
+        self.first = max(
+            [size if isinstance(size, int) else 0]
+            + [max(entries, default=0) + 1 for entries in source.xref.values()]
+            + [max(source.xref_objStm, default=0) + 1]
+        )
+        # The cross-reference section has the same form as the one before.
+        source.stream.seek(source._startxref)
+        self.xref_stream = xref_stream or not source.stream.read(
+            20
+        ).lstrip().startswith(b"xref")
+        self.tree = tree
+        self.reserve_ref(tree)
+
+    # Copy the original document.
+    def write_header(self, version: str) -> None:
+        stream = self.original.stream
+        stream.seek(0, 2)
+        size = stream.tell()
+        self.outfile.flush()
+        copied = 0
+        if self.source_name is not None:
+            try:
+                with open(self.source_name, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == size:
+                        while copied < size:
+                            n = os.copy_file_range(
+                                f.fileno(), self.outfile.fileno(), size - copied
+                            )
+                            if n == 0:
+                                break
+                            copied += n
+            except (OSError, AttributeError):  # AttributeError: not Linux
+                pass
+        stream.seek(copied)
+        shutil.copyfileobj(stream, self.outfile)
+        self.offset = size
+        stream.seek(size - 1)
+        if stream.read(1) not in (b"\n", b"\r"):
+            self.write(b"\n")
+
+    def reference(self, ref: IndirectObject) -> bytes:
+        if ref.pdf is self.original:
+            return b"%d %d R" % (ref.idnum, ref.generation)
+        return super().reference(ref)
+
+    def write_raw(self, num: int, data: bytes) -> None:
+        if num >= self.first:
+            super().write_raw(num, data)
+        else:
+            generation = self.generations[num]
+            self.replaced[num] = (generation, self.offset)
+            self.write(b"%d %d obj\n" % (num, generation) + data + b"\nendobj\n")
+
+    # Add a page of `source', which may have had its attributes changed, or
+    # a new page, to the new page tree.
+    def add_page(self, page: PageObject) -> None:
+        new_page = DictionaryObject(page)
+        new_page[NameObject("/Parent")] = self.tree
+        ref = page.indirect_reference
+        if (
+            ref is not None
+            and ref.pdf is self.original
+            and ref.idnum < self.first
+            and ref.idnum not in self.generations
+        ):
+            num, generation = ref.idnum, ref.generation
+            self.generations[num] = generation
+        else:
+            num, generation = self.reserve(), 0
+        self.kids.append((num, generation))
+        self.add(new_page, num)
+
+    def add_blank_page(self, width: float, height: float) -> None:
+        self.add_page(PageObject.create_blank_page(width=width, height=height))
+
+    # Write the page tree, the catalog, and the cross-reference section and
+    # trailer, which refers to the one before. `version' is the version of
+    # PDF that the pages need.
+    def finish_update(self, version: str) -> None:
+        self.write_data(
+            self.ref(self.tree),
+            b"<</Type/Pages/Kids[%s]/Count %d>>"
+            % (b" ".join(b"%d %d R" % kid for kid in self.kids), len(self.kids)),
+            False,
+        )
+        root = DictionaryObject(self.original.root_object)
+        root[NameObject("/Pages")] = self.tree
+        old_version = root.get("/Version")
+        if version > max(
+            self.original.pdf_header,
+            "%PDF-" + old_version[1:] if isinstance(old_version, str) else "",
+        ):
+            root[NameObject("/Version")] = NameObject(
+                "/" + version.removeprefix("%PDF-")
+            )
+        root_ref = self.original.trailer.raw_get("/Root")
+        self.generations[root_ref.idnum] = root_ref.generation
+        self.add(root, root_ref.idnum)
+        trailer = io.BytesIO()
+        trailer.write(b"/Root %d %d R" % (root_ref.idnum, root_ref.generation))
+        for key in ("/Info", "/ID"):
+            if key in self.original.trailer:
+                trailer.write(key.encode() + b" ")
+                self.serialize(self.original.trailer.raw_get(key), trailer)
+        trailer.write(b"/Prev %d" % self.original._startxref)
+        # The cross-reference stream is the last object.
+        xref_num = self.first + len(self.xref)
+        if self.xref_stream:
+            self.reserve()
+            self.xref[xref_num - self.first] = (1, self.offset)
+        entries = sorted(
+            [
+                (num, generation, offset)
+                for num, (generation, offset) in self.replaced.items()
+            ]
+            + [(num, 0, entry[1]) for num, entry in enumerate(self.xref, self.first)]
+        )
+        # Divide the entries into runs of consecutive object numbers.
+        sections: list[list[tuple[int, int, int]]] = []
+        for entry in entries:
+            if len(sections) > 0 and sections[-1][-1][0] + 1 == entry[0]:
+                sections[-1].append(entry)
+            else:
+                sections.append([entry])
+        size = self.first + len(self.xref)
+        xref_offset = self.offset
+        if self.xref_stream:
+            width = max(1, (self.offset.bit_length() + 7) // 8)
+            rows = [
+                b"\x01" + offset.to_bytes(width) + generation.to_bytes(2)
+                for _, generation, offset in entries
+            ]
+            index = b" ".join(
+                b"%d %d" % (section[0][0], len(section)) for section in sections
+            )
+            data = zlib.compress(b"".join(rows), self.level)
+            self.write(
+                b"%d 0 obj\n<</Type/XRef/Size %d/Index[%s]/W[1 %d 2]/Filter/FlateDecode/Length %d%s>>\nstream\n"
+                % (xref_num, size, index, width, len(data), trailer.getvalue())
+                + data
+                + b"\nendstream\nendobj\n"
+            )
+        else:
+            # Readers expect the table to start with the head of the free list.
+            rows = [b"xref\n0 1\n0000000000 65535 f \n"]
+            for section in sections:
+                rows.append(b"%d %d\n" % (section[0][0], len(section)))
+                rows.extend(
+                    b"%010d %05d n \n" % (offset, generation)
+                    for _, generation, offset in section
+                )
+            rows.append(b"trailer\n<</Size %d%s>>\n" % (size, trailer.getvalue()))
+            self.write(b"".join(rows))
+        self.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+        self.outfile.flush()
@@ -0,0 +1,58 @@
+"""PDF engine differential tests.
+
+Check that each PDF engine produces the same pages.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+from collections.abc import Callable
+from contextlib import chdir
+from pathlib import Path
+
+import pytest
+from pytest import CaptureFixture, mark, param
+from test_psjoin import psjoin_to_file
+from testutils import compare_image_files
+
+from psutils.command.psbook import psbook
+from psutils.command.psnup import psnup
+from psutils.command.psresize import psresize
+from psutils.command.psselect import psselect
+from psutils.command.pstops import pstops
+
+
+pytest.importorskip("pikepdf")
+
+FIXTURE_DIR = Path(__file__).parent.resolve() / "test-files"
+
+
+@mark.parametrize(
+    "function,args,input_file",
+    [
+        param(psselect, ["1,1,2,_1"], "a4-20", id="psselect"),
+        param(psbook, ["-s8"], "a4-20", id="psbook"),
+        param(pstops, ["2:0L@0.7(21cm,0)+1U(21cm,29.7cm)"], "a4-20", id="pstops"),
+        param(pstops, ["-pa4", "1:0@1(1cm,2cm)"], "a5-20", id="pstops-offset"),
+        param(psnup, ["-4"], "a4-11", id="psnup"),
+        param(psresize, ["-pa5", "--compress-level", "9"], "a4-3", id="psresize"),
+        param(psjoin_to_file, ["--even", "--object-streams"], "a4-3", id="psjoin"),
+    ],
+)
+@mark.datafiles
+def test_engines(
+    function: Callable[[list[str]], None],
+    args: list[str],
+    input_file: str,
+    capsys: CaptureFixture[str],
+    datafiles: Path,
+) -> None:
+    test_file = FIXTURE_DIR / f"{input_file}.pdf"
+    with chdir(datafiles):
+        for engine in ("pypdf", "pikepdf"):
+            function(
+                [*args, "--pdf-engine", engine, str(test_file), f"output-{engine}.pdf"]
+            )
+        assert compare_image_files(
+            capsys, datafiles / "output-pikepdf.pdf", datafiles / "output-pypdf.pdf"
+        )
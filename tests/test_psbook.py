@@ -24,6 +24,11 @@ pytestmark = make_tests(
         ["-s", "4"],
         GeneratedInput("a4", 3),
     ),
+    Case(
+        "3-incremental",
+        ["--incremental"],
+        GeneratedInput("a4", 3),
+    ),
     Case(
         "20",
         [],
@@ -34,6 +39,11 @@ pytestmark = make_tests(
         ["-s", "4"],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "11-signature-8",
+        ["-s", "8"],
+        GeneratedInput("a4", 11),
+    ),
     Case(
         "invalid-signature-size",
         ["-s", "3"],
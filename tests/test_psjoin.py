@@ -46,5 +46,10 @@ pytestmark = make_tests(
         ["--save"],
         GeneratedInput("a4", 1),
     ),
+    Case(
+        "1-2-compressed",
+        ["--compress-level", "9", "--object-streams", "--remove-duplicates"],
+        GeneratedInput("a4", 1),
+    ),
 )
 test_psjoin = file_test
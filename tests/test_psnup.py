@@ -34,6 +34,16 @@ pytestmark = make_tests(
         ["-p", "a4", "-4"],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "20-4-jobs",
+        ["-p", "a4", "--jobs", "2", "-4"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "11-2-booklet-8",
+        ["-p", "a4", "--booklet", "-s8", "-2"],
+        GeneratedInput("a4", 11),
+    ),
     Case(
         "20-1-flip",
         ["-p", "a4", "-1", "-f"],
@@ -110,6 +120,11 @@ pytestmark = make_tests(
         ["-p", "a4", "-4", "-m", "10pt"],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "20-100-margin-10",
+        ["-p", "a4", "-100", "-m", "10pt"],
+        GeneratedInput("a4", 20),
+    ),
     Case(
         "20-4-inpaper-A5",
         ["-p", "a4", "-4"],
@@ -125,6 +140,11 @@ pytestmark = make_tests(
         ["-p", "a4", "-4", "-c"],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "20-4-prune-resources",
+        ["-p", "a4", "-4", "--prune-resources"],
+        GeneratedInput("a4", 20),
+    ),
     Case(
         "20-4-impossible-border",
         ["-p", "a4", "-4", "-b", "1000pt"],
@@ -164,5 +184,25 @@ pytestmark = make_tests(
         ["-2", "-P612x792", "-ptabloid"],
         "no-document-media",
     ),
+    Case(
+        "image-dpi",
+        ["--image-dpi", "150", "-4"],
+        "image",
+    ),
+    Case(
+        "dedupe-pages",
+        ["--dedupe-pages", "-2"],
+        "duplicate-pages",
+    ),
+    Case(
+        "minify",
+        ["--minify", "-2"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "compress-pages",
+        ["--compress-pages", "-2"],
+        GeneratedInput("a4", 20),
+    ),
 )
 test_psnup = file_test
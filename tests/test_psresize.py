@@ -44,5 +44,15 @@ pytestmark = make_tests(
         ["-p", "a4"],
         GeneratedInput("a3", 20),
     ),
+    Case(
+        "mixed-sizes",
+        ["-p", "a4"],
+        "mixed-sizes",
+    ),
+    Case(
+        "cropped",
+        ["-p", "a5"],
+        "cropped",
+    ),
 )
 test_psresize = file_test
@@ -93,5 +93,62 @@ pytestmark = make_tests(
         ["--pages", "1-18"],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "prune-resources",
+        ["--prune-resources", "1-3"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "object-streams",
+        ["--object-streams", "--compress-level", "9", "1-3"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "repeated-pages",
+        ["1,1,2"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "page-tree",
+        ["7,1,7,_1"],
+        "page-tree",
+    ),
+    Case(
+        "repeated-pages-compress",
+        ["--compress-level", "9", "1,1"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "form-fields",
+        ["1"],
+        "form-fields",
+    ),
+    Case(
+        "incremental",
+        ["--incremental", "1,3,1"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "remove-duplicates",
+        ["--remove-duplicates", "1-3"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "split-invalid-range",
+        ["--split", "1-5,6-30", "1-_1"],
+        GeneratedInput("a4", 20),
+        2,
+    ),
+    Case(
+        "split-zero",
+        ["--split", "0", "1-_1"],
+        "no-input",
+        1,
+    ),
+    Case(
+        "dedupe-pages",
+        ["--dedupe-pages", "1-_1"],
+        "duplicate-pages",
+    ),
 )
 test_psselect = file_test
@@ -37,6 +37,11 @@ pytestmark = make_tests(
         ["--specs", "2:0(100pt,200pt),1(-200pt,100pt)"],
         GeneratedInput("a4", 2),
     ),
+    Case(
+        "rotate-and-scale",
+        ["--specs", "0R@.5(2cm,10cm)"],
+        GeneratedInput("a4", 1),
+    ),
     Case(
         "multiple-turns-and-flips",
         ["--specs", "0LLRVHVHV(700pt,0pt)"],
@@ -58,6 +63,25 @@ pytestmark = make_tests(
         ["-pa4", "--specs", "2:0L@.7(21cm,0)+1L@.7(21cm,14.85cm)"],
         GeneratedInput("a4", 11),
     ),
+    Case(
+        "sections",
+        [
+            "-pa4",
+            "--section",
+            "1=0",
+            "--section",
+            "2-9=2:0L@.7(21cm,0)+1L@.7(21cm,14.85cm)",
+            "--section",
+            "10-11=0U(21cm,29.7cm)",
+        ],
+        GeneratedInput("a4", 11),
+    ),
+    Case(
+        "sections-with-specs",
+        ["--section", "1=0", "--specs", "0"],
+        GeneratedInput("a4", 1),
+        1,
+    ),
     Case(  # Test we can refer to the paper size in a dimension when output size is not set
         "default-paper-size",
         ["--specs", "0L@.7(1w,0)+0L@.7(1w,.5h)"],
@@ -71,6 +95,21 @@ pytestmark = make_tests(
         ],
         GeneratedInput("a4", 20),
     ),
+    Case(
+        "dedupe-cropped",
+        ["--dedupe-pages", "1:0@0.5+0@0.5(300,0)"],
+        "cropped",
+    ),
+    Case(
+        "page-tree",
+        ["2:0L@0.7(21cm,0)+1U(21cm,29.7cm),1"],
+        "page-tree",
+    ),
+    Case(
+        "cropped",
+        ["0R(0,595)"],
+        "cropped",
+    ),
 )
 with mock.patch.dict(os.environ, {"PAPERSIZE": "A4"}):
     test_pstops = file_test
@@ -0,0 +1,90 @@
+"""psutils tests.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+from pathlib import Path
+
+from testutils import Case, GeneratedInput, file_test, make_tests
+
+from psutils.command.psutils import psutils
+
+
+pytestmark = make_tests(
+    psutils,
+    Path(__file__).parent.resolve() / "test-files",
+    Case(
+        "pipeline-select-nup",
+        ["pipeline", "-e", "psselect 1-10", "-e", "psnup -p a4 -2"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "pipeline-book-nup",
+        ["pipeline", "-e", "psbook -s8", "-e", "psnup -p a4 -2"],
+        GeneratedInput("a4", 11),
+    ),
+    Case(
+        "pipeline-stops-resize",
+        [
+            "pipeline",
+            "--stage",
+            "pstops 2:0L@0.7(21cm,0)+1U(21cm,29.7cm)",
+            "--stage",
+            "psresize -pa5",
+        ],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "pipeline-invalid-stage",
+        ["pipeline", "-e", "psjoin"],
+        "no-input",
+        1,
+    ),
+    Case(
+        "pipeline-split-stage",
+        ["pipeline", "-e", "psselect --split 5"],
+        "no-input",
+        1,
+    ),
+    Case(
+        "fanout-odd-even",
+        ["fanout", "-q", "-e", "psselect -o", "-t", "even", "-e", "psselect -e"],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "fanout-nup",
+        [
+            "fanout",
+            "-q",
+            "-e",
+            "psselect -o",
+            "-e",
+            "psnup -p a4 -2",
+            "-t",
+            "even",
+            "-e",
+            "psselect -e",
+        ],
+        GeneratedInput("a4", 20),
+    ),
+    Case(
+        "fanout-two-stdout",
+        [
+            "fanout",
+            "-e",
+            "psselect",
+            "-t",
+            "-",
+            "-e",
+            "psselect -o",
+            "-t",
+            "-",
+            "-e",
+            "psselect -e",
+        ],
+        "no-input",
+        1,
+    ),
+)
+test_psutils = file_test
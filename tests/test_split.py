@@ -0,0 +1,52 @@
+"""Tests of splitting output into several files.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import re
+from contextlib import chdir
+from pathlib import Path
+
+from pypdf import PdfReader
+from pytest import CaptureFixture, mark, param
+
+from psutils.command.psselect import psselect
+
+
+FIXTURE_DIR = Path(__file__).parent.resolve() / "test-files"
+
+
+def count_pages(file: Path) -> int:
+    if file.suffix == ".pdf":
+        return len(PdfReader(file).pages)
+    return len(re.findall(rb"^%%Page:", file.read_bytes(), re.MULTILINE))
+
+
+@mark.parametrize(
+    "args,pages",
+    [
+        param(["--split", "7", "1-_1"], [7, 7, 6], id="pages"),
+        param(["--split", "2", "1-_1"], [2] * 10, id="pages-two-digits"),
+        param(["--split", "1-5,_1-_5", "1-_1"], [5, 5], id="ranges"),
+        param(["--split", "3", "1-4"], [3, 1], id="selection"),
+    ],
+)
+@mark.datafiles
+def test_split(
+    args: list[str],
+    pages: list[int],
+    file_type: str,
+    capsys: CaptureFixture[str],
+    datafiles: Path,
+) -> None:
+    test_file = FIXTURE_DIR / f"a4-20{file_type}"
+    with chdir(datafiles):
+        psselect([*args, str(test_file), f"output{file_type}"])
+        width = len(str(len(pages)))
+        names = [f"output-{i:0{width}d}{file_type}" for i in range(1, len(pages) + 1)]
+        assert sorted(p.name for p in datafiles.glob("output*")) == names
+        assert [count_pages(datafiles / name) for name in names] == pages
+        assert capsys.readouterr().err.endswith(
+            "".join(f"Wrote {n} pages to {name}\n" for n, name in zip(pages, names))
+        )
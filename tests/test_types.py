@@ -0,0 +1,198 @@
+"""Tests of page lists and imposition plans.
+
+Copyright (c) Reuben Thomas 2025.
+Released under the GPL version 3, or (at your option) any later version.
+"""
+
+import pytest
+from pytest import mark, param
+
+from psutils.argparse import parserange
+from psutils.transformers import page_plan
+from psutils.types import ImpositionPlan, PageList, PageSpec, SignatureOrder
+
+
+def page_list(
+    text: str,
+    total_pages: int = 10,
+    reverse: bool = False,
+    odd: bool = False,
+    even: bool = False,
+) -> PageList:
+    return PageList(total_pages, parserange(text), reverse, odd, even)
+
+
+def plan_pages(plan: ImpositionPlan) -> list[list[int]]:
+    return [
+        [placement.page for placement in plan.placements(outputpage)]
+        for outputpage in range(1, plan.num_pages() + 1)
+    ]
+
+
+def plan_labels(plan: ImpositionPlan) -> list[str]:
+    return [plan.label(outputpage) for outputpage in range(1, plan.num_pages() + 1)]
+
+
+@mark.parametrize(
+    "text,options,pages",
+    [
+        param("1-4", {}, [0, 1, 2, 3], id="range"),
+        param("4-1", {}, [3, 2, 1, 0], id="descending-range"),
+        param("_", {}, [-1], id="blank"),
+        param("1,_,3", {}, [0, -1, 2], id="blank-between"),
+        param("2-5", {"odd": True}, [2, 4], id="odd"),
+        param("2-5", {"even": True}, [1, 3], id="even"),
+        param("2-5", {"odd": True, "even": True}, [1, 2, 3, 4], id="odd-and-even"),
+        param("2", {"odd": True}, [], id="empty"),
+        param("1-3,5-6", {"reverse": True}, [5, 4, 2, 1, 0], id="reverse"),
+    ],
+)
+def test_page_list(text: str, options: dict[str, bool], pages: list[int]) -> None:
+    pl = page_list(text, **options)
+    assert list(pl) == pages
+    assert len(pl) == pl.num_pages() == len(pages)
+    assert [pl[n] for n in range(len(pl))] == pages
+
+
+def test_page_list_index() -> None:
+    pl = page_list("1-3,7-8")
+    assert pl[3] == 6
+    with pytest.raises(IndexError):
+        pl[-1]
+    with pytest.raises(IndexError):
+        pl[5]
+    assert pl.real_page(-1) == 0
+    assert pl.real_page(5) == 0
+    assert pl.real_pages(range(2, 7)) == [2, 6, 7, 0, 0]
+    assert page_list("1-3").real_pages(range(2, 5)) == [2, 0, 0]
+
+
+def test_page_list_invalid_range() -> None:
+    with pytest.raises(SystemExit), pytest.warns(UserWarning, match="is invalid"):
+        page_list("1-11")
+
+
+def test_page_list_from_pages() -> None:
+    pl = PageList.from_pages([2, -1, 0])
+    assert list(pl) == [2, -1, 0]
+    assert pl[1] == -1
+    assert len(PageList.from_pages([])) == 0
+
+
+@mark.parametrize(
+    "total_pages,signature,pages",
+    [
+        param(8, 8, [7, 0, 1, 6, 5, 2, 3, 4], id="one-signature"),
+        param(6, 0, [-1, 0, 1, -1, 5, 2, 3, 4], id="whole-document"),
+        param(9, 4, [3, 0, 1, 2, 7, 4, 5, 6, -1, 8, -1, -1], id="several"),
+        param(0, 4, [], id="empty"),
+    ],
+)
+def test_signature_order(total_pages: int, signature: int, pages: list[int]) -> None:
+    order = SignatureOrder(total_pages, signature)
+    assert list(order) == pages
+    assert order[:] == pages
+    assert len(order) == len(pages)
+
+
+def test_signature_order_index() -> None:
+    order = SignatureOrder(6, 0)
+    assert order[-1] == 4
+    assert order[-8] == -1
+    assert order[1:3] == [0, 1]
+    with pytest.raises(IndexError):
+        order[8]
+    with pytest.raises(IndexError):
+        order[-9]
+
+
+def test_plan() -> None:
+    plan = page_plan(
+        3, [[PageSpec(pageno=0), PageSpec(pageno=1)]], None, False, False, False, 2
+    )
+    assert plan.num_pages() == 2
+    assert plan_pages(plan) == [[0, 1], [2, -1]]
+    # The page that fills the last output page is labelled as the first.
+    assert plan_labels(plan) == ["1,2", "3,1"]
+    assert list(plan.output_page) == [1, 1, 2, 2]
+    assert list(plan.slot) == [0, 1, 0, 1]
+    assert plan.transforms_pages()
+
+
+def test_plan_reversed_spec() -> None:
+    plan = page_plan(
+        4,
+        [[PageSpec(reversed=True), PageSpec()]],
+        None,
+        False,
+        False,
+        False,
+        1,
+    )
+    assert plan_pages(plan) == [[3, 0], [2, 1], [1, 2], [0, 3]]
+
+
+def test_plan_blank_pages() -> None:
+    plan = page_plan(10, [[PageSpec()]], parserange("1,_,_2"), False, False, False, 1)
+    assert plan_pages(plan) == [[0], [-1], [8]]
+    assert plan_labels(plan) == ["1", "*", "9"]
+    assert not plan.transforms_pages()
+
+
+def test_plan_negative_range() -> None:
+    # Pages before the first are taken to be the first.
+    plan = page_plan(10, [[PageSpec()]], parserange("_30-_25"), False, False, False, 1)
+    assert plan_pages(plan) == [[0]]
+    plan = page_plan(10, [[PageSpec()]], parserange("_3-_1"), False, False, False, 1)
+    assert plan_pages(plan) == [[7], [8], [9]]
+
+
+def test_plan_empty() -> None:
+    plan = page_plan(10, [[PageSpec()]], parserange("2"), False, True, False, 1)
+    assert plan.num_pages() == 0
+    assert list(plan.start) == [0]
+    assert not plan.transforms_pages()
+    assert ImpositionPlan.concatenate([plan, plan]).num_pages() == 0
+    assert plan.extract([]).num_pages() == 0
+    assert ImpositionPlan.from_placements([]).num_pages() == 0
+
+
+def test_plan_concatenate_and_extract() -> None:
+    first = page_plan(
+        3,
+        [[PageSpec(pageno=0), PageSpec(pageno=1, rotate=90)]],
+        None,
+        False,
+        False,
+        False,
+        2,
+    )
+    second = page_plan(10, [[PageSpec()]], parserange("1,_,_2"), False, False, False, 1)
+    plan = ImpositionPlan.concatenate([first, second])
+    assert plan_pages(plan) == [[0, 1], [2, -1], [0], [-1], [8]]
+    assert plan_labels(plan) == ["1,2", "3,1", "1", "*", "9"]
+    assert list(plan.output_page) == [1, 1, 2, 2, 3, 4, 5]
+    assert [s.rotate for s in plan.spec_list] == [0, 90, 0]
+    extracted = plan.extract([5, 1])
+    assert plan_pages(extracted) == [[8], [0, 1]]
+    assert list(extracted.output_page) == [1, 2, 2]
+    assert [p.spec.rotate for p in extracted.placements(2)] == [0, 90]
+
+
+def test_plan_from_placements() -> None:
+    plan = page_plan(
+        3,
+        [[PageSpec(pageno=0), PageSpec(pageno=1)]],
+        None,
+        False,
+        False,
+        False,
+        2,
+    )
+    copy = ImpositionPlan.from_placements(
+        plan.labelled_placements(outputpage)
+        for outputpage in range(1, plan.num_pages() + 1)
+    )
+    assert plan_pages(copy) == plan_pages(plan)
+    assert plan_labels(copy) == plan_labels(plan)
+    assert len(copy.spec_list) == 2